@@ -0,0 +1,677 @@
+"""
+Performance checks for the simulation modules.
+Run `python benchmarks.py` and it exits with a non-zero status when a check fails.
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Modules that must only be loaded by the features that need them (GUI and plots)
+HEAVY_MODULES = ('tkinter', 'matplotlib', 'numpy')
+
+# Cold import budget (seconds) for the modules a headless batch worker loads
+STARTUP_BUDGETS = {
+    'simulation_utils': 0.2,
+    'simulation': 0.2,
+    'visualization': 0.05,
+}
+
+# Largest difference allowed between the vectorised rules and the Cell based ones
+RULE_DIVERGENCE_TOLERANCE = 1e-9
+
+# Largest relative difference allowed between the float32 and float64 states after 365 steps
+PRECISION_DRIFT_TOLERANCE = {
+    'temp': 1e-4,
+    'pollution': 1e-2,
+    'wind_speed': 1e-4,
+    'gen_pollution': 1e-6,
+    'absorb_pollution': 1e-6,
+}
+
+# Peak memory of a streaming step, as a multiple of the bytes of one band (with its halo rows)
+STREAMING_MEMORY_FACTOR = 10
+
+# Smallest speed-up (per cell) of the packed cloud engine over calc_cloud_state
+CLOUD_ENGINE_MIN_SPEEDUP = 100
+
+# Largest mean time of FrameExporter.submit, as a fraction of the mean time of one step
+FRAME_SUBMIT_BUDGET = 0.5
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': sorted(sys.modules)}}))
+"""
+
+def measure_startup(module_name, runs=5):
+    """
+    Import a module in fresh interpreters and measure the cold import time.
+
+    Returns:
+    - (best_seconds, heavy_modules, error): the fastest import time over `runs`, the heavy
+      modules (see HEAVY_MODULES) that were loaded by the import, and the last line of the
+      error output if the import failed (best_seconds is then None).
+    """
+    best_seconds = None
+    heavy_modules = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module_name)],
+            cwd=PROJECT_DIR, capture_output=True, text=True, check=False
+        )
+        if result.returncode != 0:
+            error_lines = result.stderr.strip().splitlines()
+            return None, [], error_lines[-1] if error_lines else f"exit status {result.returncode}"
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        if best_seconds is None or probe['seconds'] < best_seconds:
+            best_seconds = probe['seconds']
+        heavy_modules.update(name for name in probe['modules'] if name.split('.')[0] in HEAVY_MODULES)
+    return best_seconds, sorted({name.split('.')[0] for name in heavy_modules}), None
+
+def check_startup(budgets=STARTUP_BUDGETS, runs=5):
+    """
+    Check every module in `budgets` imports within its budget and without heavy modules.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    failures = []
+    for module_name, budget in budgets.items():
+        seconds, heavy_modules, error = measure_startup(module_name, runs)
+        if error:
+            failures.append(f"{module_name} failed to import: {error}")
+            continue
+        print(f"{module_name}: {seconds * 1000:.1f} ms (budget {budget * 1000:.0f} ms)")
+        if seconds > budget:
+            failures.append(f"{module_name} took {seconds * 1000:.1f} ms to import, budget is {budget * 1000:.0f} ms")
+        if heavy_modules:
+            failures.append(f"{module_name} loads {', '.join(heavy_modules)} at import time")
+    return failures
+
+def measure_rule_divergence(map_size=14, steps=30, seed=0):
+    """
+    Run the Cell based next_generation and the vectorised step_rows side by side.
+    step_rows reads neighbours from the first generation, like SimulationApp, and gets the
+    same cloud and rain thresholds that calc_cloud_state draws from `random`.
+
+    Returns:
+    - dict: {field: largest absolute difference} over all steps.
+    """
+    import random
+    import numpy as np
+    from map import MapGenerator
+    from grid_state import GridState, FIELDS
+    from grid_calculations import step_rows, global_averages
+    from simulation_utils import next_generation, add_clouds_to_glaciers
+
+    map_generator = MapGenerator(map_size)
+    map = map_generator.map
+    add_clouds_to_glaciers(map, map_size, 1)
+    first_generation = GridState.from_map(map_generator.map)
+    state = GridState.from_map(map)
+    divergence = dict.fromkeys(FIELDS, 0.0)
+
+    for step in range(steps):
+        # calc_cloud_state draws the cloud then the rain threshold of every cell, row by row
+        random.seed(seed + step)
+        thresholds = np.array([random.randint(0, 3) for _ in range(2 * map_size ** 2)]).reshape(map_size, map_size, 2)
+        random.seed(seed + step)
+        map = next_generation(map, map_generator, map_size)
+
+        next_state = GridState(map_size)
+        global_temp, global_pollution = global_averages(state)
+        step_rows(state, next_state, 0, map_size, global_temp, global_pollution, neighbors=first_generation,
+                  cloud_thresholds=thresholds[..., 0], rain_thresholds=thresholds[..., 1])
+        state = next_state
+
+        expected = GridState.from_map(map)
+        for field in FIELDS:
+            difference = np.abs(getattr(expected, field).astype(np.float64) - getattr(state, field))
+            divergence[field] = max(divergence[field], float(difference.max()))
+    return divergence
+
+def check_rule_divergence(tolerance=RULE_DIVERGENCE_TOLERANCE):
+    """
+    Check the vectorised rules of grid_calculations match calculations.py.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    divergence = measure_rule_divergence()
+    largest = max(divergence.values())
+    print(f"vectorised rules vs next_generation: largest difference {largest:.3g}")
+    return [
+        f"grid_calculations {field} differs from next_generation by {value:.3g}"
+        for field, value in divergence.items() if value > tolerance
+    ]
+
+def measure_adaptive_stride(map_size=12, iterations=365, seed=0):
+    """
+    Run the simulation with AdaptiveStride(1), then feed a fresh policy averages whose per-step
+    change holds steady and then jumps fourfold (a sudden acceleration).
+
+    Returns:
+    - (observed, strides, before_jump, after_jump): the number of observed generations of the
+      run, the strides it used, and the synthetic policy's stride just before the jump and
+      right after it.
+    """
+    import random
+    from map import MapGenerator
+    from simulation_utils import AdaptiveStride, run_fast_forward
+
+    random.seed(seed)
+    map_generator = MapGenerator(map_size)
+    policy = AdaptiveStride(1)
+    strides = []
+    previous_iteration = 0
+    for iteration, _, _ in run_fast_forward(map_generator.map, map_generator, map_size, iterations, policy=policy):
+        strides.append(iteration - previous_iteration)
+        previous_iteration = iteration
+
+    policy = AdaptiveStride(1)
+    averages, stride = (20.0, 0.1), policy.stride
+    for rate in (0.015,) * 8:
+        next_averages = (averages[0] + rate * stride, averages[1] + rate / 100 * stride)
+        averages, stride = next_averages, policy.update(averages, next_averages, stride)
+    before_jump = stride
+    next_averages = (averages[0] + 0.06 * stride, averages[1])
+    after_jump = policy.update(averages, next_averages, stride)
+    return len(strides), strides, before_jump, after_jump
+
+def check_adaptive_stride(map_size=12, iterations=365):
+    """
+    Check AdaptiveStride grows the stride on a real run and halves it when the change accelerates.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    observed, strides, before_jump, after_jump = measure_adaptive_stride(map_size, iterations)
+    print(f"adaptive stride: {observed} of {iterations} generations observed (largest stride {max(strides)}), "
+          f"stride {before_jump} -> {after_jump} when the change accelerates")
+    failures = []
+    if max(strides) <= 1:
+        failures.append(f"AdaptiveStride never grew the stride ({observed} of {iterations} generations observed)")
+    if after_jump >= before_jump:
+        failures.append(f"AdaptiveStride did not shrink the stride when the change accelerated ({before_jump} -> {after_jump})")
+    return failures
+
+def measure_convergence(map_size=12, iterations=365, period=4, seed=0):
+    """
+    Replay the summaries of a real run through each convergence monitor and detector, then
+    run the same map with the default detector to see where run_fast_forward stops.
+    The cloud layout hashes of the run are replaced by a synthetic layout (a band of clouds
+    moving down the map) that repeats every `period` generations, for CloudCycleMonitor.
+
+    Returns:
+    - dict: {monitor or detector: the generation it was first met at, or None}.
+    """
+    import random
+    from map import MapGenerator
+    from simulation_utils import run_fast_forward
+    from convergence import (
+        layout_hash, ConvergenceDetector, GlobalDeltaMonitor, ElementStabilityMonitor, CloudCycleMonitor
+    )
+
+    random.seed(seed)
+    map_generator = MapGenerator(map_size)
+    run = [summary for _, _, summary in run_fast_forward(map_generator.map, map_generator, map_size, iterations)]
+    layouts = [
+        layout_hash(['cloud' if (row + generation) % period == 0 else '' for row in range(map_size) for _ in range(map_size)])
+        for generation in range(period)
+    ]
+    cyclic = [dict(summary, clouds=layouts[generation % period]) for generation, summary in enumerate(run)]
+
+    cases = {
+        'GlobalDeltaMonitor': (GlobalDeltaMonitor(), run),
+        'ElementStabilityMonitor': (ElementStabilityMonitor(), run),
+        'CloudCycleMonitor': (CloudCycleMonitor(), cyclic),
+        'default ConvergenceDetector': (ConvergenceDetector(), run),
+        'ConvergenceDetector with all three monitors': (ConvergenceDetector(
+            [GlobalDeltaMonitor(), ElementStabilityMonitor(), CloudCycleMonitor()]), cyclic),
+    }
+    met_at = {}
+    for name, (monitor, summaries) in cases.items():
+        met_at[name] = next(
+            (generation for generation, summary in enumerate(summaries, 1) if monitor.update(summary)), None
+        )
+
+    random.seed(seed)
+    map_generator = MapGenerator(map_size)
+    observations = run_fast_forward(map_generator.map, map_generator, map_size, iterations, detector=ConvergenceDetector())
+    last_iteration = max(iteration for iteration, _, _ in observations)
+    met_at['run_fast_forward with the default detector'] = last_iteration if last_iteration < iterations else None
+    return met_at
+
+def check_convergence(map_size=12, iterations=365):
+    """
+    Check every convergence monitor is met on a real run and the detectors stop it early.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    met_at = measure_convergence(map_size, iterations)
+    print(f"convergence ({map_size}x{map_size}, {iterations} steps), met at generation: " +
+          ", ".join(f"{name} {generation}" for name, generation in met_at.items()))
+    return [f"{name} was never met in {iterations} generations" for name, generation in met_at.items() if generation is None]
+
+def measure_precision_drift(map_size=100, steps=365, seed=0):
+    """
+    Run the same simulation with float64 and float32 states and compare them.
+    Both runs draw the same random cloud thresholds, so all differences come from precision.
+
+    Returns:
+    - dict: {field: largest relative difference} for the float fields, plus the fraction
+      of cells whose 'element' and 'clouds' differ.
+    """
+    import numpy as np
+    from grid_state import GridState, FLOAT_FIELDS
+    from grid_calculations import step_state, add_clouds_to_glaciers_state
+
+    reference = GridState.create(map_size, 'float64')
+    add_clouds_to_glaciers_state(reference)
+    reduced = reference.copy('float32')
+    reference_rng = np.random.default_rng(seed)
+    reduced_rng = np.random.default_rng(seed)
+
+    for _ in range(steps):
+        reference = step_state(reference, reference_rng)
+        reduced = step_state(reduced, reduced_rng)
+
+    drift = {}
+    for field in FLOAT_FIELDS:
+        expected = getattr(reference, field)
+        difference = np.abs(expected - getattr(reduced, field).astype(np.float64))
+        drift[field] = float(np.max(difference / np.maximum(np.abs(expected), 1e-12)))
+    drift['element'] = float(np.mean(reference.element != reduced.element))
+    drift['clouds'] = float(np.mean(reference.clouds != reduced.clouds))
+    return drift
+
+def check_precision_drift(tolerances=PRECISION_DRIFT_TOLERANCE, map_size=100, steps=365):
+    """
+    Check the float32 state stays within `tolerances` of the float64 state and that no
+    cell ends up with a different element or cloud state.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    failures = []
+    drift = measure_precision_drift(map_size, steps)
+    for field, value in drift.items():
+        print(f"float32 drift after {steps} steps - {field}: {value:.3g}")
+        if value > tolerances.get(field, 0):
+            failures.append(f"float32 {field} drifted by {value:.3g} after {steps} steps")
+    return failures
+
+def measure_step_memory(map_size=1000, precision='float32'):
+    """
+    Measure the peak memory of one step_state call, including the current generation.
+
+    Returns:
+    - (peak_bytes, estimated_bytes): the traced peak and grid_state.estimate_memory.
+    """
+    import tracemalloc
+    import numpy as np
+    from grid_state import GridState, estimate_memory
+    from grid_calculations import step_state
+
+    state = GridState.create(map_size, precision=precision)
+    tracemalloc.start()
+    step_state(state, np.random.default_rng(0))
+    peak_bytes = tracemalloc.get_traced_memory()[1] + state.nbytes
+    tracemalloc.stop()
+    return peak_bytes, estimate_memory(map_size, precision)
+
+def check_step_memory(map_size=1000):
+    """
+    Check estimate_memory covers the peak memory of step_state in every precision mode.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    failures = []
+    for precision in ('float64', 'float32'):
+        peak_bytes, estimated_bytes = measure_step_memory(map_size, precision)
+        print(f"step_state peak memory ({precision}, {map_size}x{map_size}): {peak_bytes / 1e6:.2f} MB "
+              f"(estimate {estimated_bytes / 1e6:.2f} MB)")
+        if peak_bytes > estimated_bytes:
+            failures.append(f"step_state used {peak_bytes / 1e6:.2f} MB in {precision}, more than the "
+                            f"{estimated_bytes / 1e6:.2f} MB estimate")
+    return failures
+
+def measure_streaming_memory(map_size=1000, band_rows=32, precision='float32'):
+    """
+    Measure the peak memory allocated while a StreamingSimulation computes one step.
+
+    Returns:
+    - (peak_bytes, band_bytes): the traced peak and the bytes of one band with its halo rows.
+    """
+    import tempfile
+    import tracemalloc
+    from grid_state import estimate_memory
+    from streaming import StreamingSimulation
+
+    with tempfile.TemporaryDirectory() as directory:
+        simulation = StreamingSimulation(directory, map_size, band_rows, precision, seed=0)
+        tracemalloc.start()
+        simulation.step()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del simulation
+
+    band_bytes = estimate_memory(map_size, precision, generations=1, band_rows=None) * (band_rows + 2) // map_size
+    return peak_bytes, band_bytes
+
+def check_streaming_memory(factor=STREAMING_MEMORY_FACTOR, map_size=1000, band_rows=32):
+    """
+    Check the peak memory of a streaming step is bounded by the band size, not the map size.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    peak_bytes, band_bytes = measure_streaming_memory(map_size, band_rows)
+    print(f"streaming step peak memory: {peak_bytes / 1e6:.2f} MB (band {band_bytes / 1e6:.2f} MB)")
+    if peak_bytes > factor * band_bytes:
+        return [f"streaming step used {peak_bytes / 1e6:.2f} MB, more than {factor} bands"]
+    return []
+
+def measure_coarse_preview(map_size=120, factor=4, steps=365, seed=0):
+    """
+    Compare a coarse preview (and its refined blocks) with the full resolution run.
+
+    Returns:
+    - dict: Run times in seconds ('full_seconds', 'preview_seconds'), errors against the full run
+      (RMSE of temperature and pollution, the fraction of cells with a different element) and,
+      in 'refined', for the temperature hotspots and for the mixed-element blocks: the fraction
+      of blocks refined, the refinement time and the largest temperature error inside those
+      blocks before ('preview_error') and after ('refined_error') refinement.
+    """
+    import time
+    import numpy as np
+    from grid_state import GridState
+    from grid_calculations import step_state, add_clouds_to_glaciers_state
+    from coarse import run_preview, find_hotspots, mixed_blocks, refine_hotspots
+
+    state = GridState.create(map_size)
+    add_clouds_to_glaciers_state(state)
+
+    start = time.perf_counter()
+    full = state
+    rng = np.random.default_rng(seed)
+    for _ in range(steps):
+        full = step_state(full, rng)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    preview, global_history = run_preview(state, factor, steps, seed)
+    preview_seconds = time.perf_counter() - start
+    report = {
+        'full_seconds': full_seconds,
+        'preview_seconds': preview_seconds,
+        'temp_rmse': float(np.sqrt(np.mean((full.temp - preview.temp) ** 2))),
+        'pollution_rmse': float(np.sqrt(np.mean((full.pollution - preview.pollution) ** 2))),
+        'element_mismatch': float(np.mean(full.element != preview.element)),
+        'refined': {},
+    }
+
+    for name, selected in (('hotspots', find_hotspots(preview, factor)), ('mixed blocks', mixed_blocks(state, factor))):
+        fine = np.repeat(np.repeat(selected, factor, axis=0), factor, axis=1)
+        preview_error = float(np.max(np.abs(full.temp - preview.temp)[fine]))
+        start = time.perf_counter()
+        refined = refine_hotspots(state, preview.copy(), global_history, selected, factor, seed=seed)
+        report['refined'][name] = {
+            'fraction': float(np.mean(selected)),
+            'seconds': time.perf_counter() - start,
+            'preview_error': preview_error,
+            'refined_error': float(np.max(np.abs(full.temp - refined.temp)[fine])),
+        }
+    return report
+
+def report_coarse_preview(map_size=120, factor=4, steps=365):
+    """Print the run time and error of a coarse preview (and its refined blocks) against the full resolution run."""
+    report = measure_coarse_preview(map_size, factor, steps)
+    print(f"coarse preview ({factor}x{factor} blocks, {steps} steps): {report['preview_seconds']:.2f} s "
+          f"vs full {report['full_seconds']:.2f} s")
+    print(f"coarse preview error: temperature RMSE {report['temp_rmse']:.3f}, "
+          f"pollution RMSE {report['pollution_rmse']:.4f}, elements {report['element_mismatch']:.2%}")
+    for name, refined in report['refined'].items():
+        print(f"refining {name} ({refined['fraction']:.1%} of blocks) in {refined['seconds']:.2f} s: "
+              f"largest temperature error {refined['preview_error']:.4f} preview, "
+              f"{refined['refined_error']:.4f} refined")
+    return []
+
+def measure_cloud_engine(map_size=1000, cell_map_size=60, steps=20):
+    """
+    Time the packed cloud engine against calc_cloud_state evaluated cell by cell.
+
+    Returns:
+    - (packed_seconds, per_cell_seconds): the time per cell and step of each engine.
+    """
+    import random
+    import time
+    import numpy as np
+    from map import MapGenerator
+    from calculations import calc_cloud_state
+    from cloud_engine import CloudEngine
+
+    rng = np.random.default_rng(0)
+    engine = CloudEngine.from_codes(rng.integers(0, 3, size=(map_size, map_size)).astype(np.uint8), seed=0)
+    start = time.perf_counter()
+    for _ in range(steps):
+        engine.step()
+    packed_seconds = (time.perf_counter() - start) / steps / map_size ** 2
+
+    map_generator = MapGenerator(cell_map_size)
+    start = time.perf_counter()
+    for row in map_generator.map:
+        for cell in row:
+            calc_cloud_state(map_generator, cell, random.randint(0, 3), random.randint(0, 3))
+    per_cell_seconds = (time.perf_counter() - start) / cell_map_size ** 2
+    return packed_seconds, per_cell_seconds
+
+def check_cloud_engine(min_speedup=CLOUD_ENGINE_MIN_SPEEDUP):
+    """
+    Check the packed cloud engine is at least `min_speedup` times faster per cell than calc_cloud_state.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    packed_seconds, per_cell_seconds = measure_cloud_engine()
+    speedup = per_cell_seconds / packed_seconds
+    print(f"cloud engine: {packed_seconds * 1e9:.2f} ns per cell vs {per_cell_seconds * 1e9:.0f} ns "
+          f"with calc_cloud_state ({speedup:.0f}x)")
+    if speedup < min_speedup:
+        return [f"packed cloud engine is only {speedup:.0f}x faster than calc_cloud_state"]
+    return []
+
+def measure_cloud_engine_divergence(sizes=(10, 70, 130), steps=4, seed=0):
+    """
+    Run the packed cloud engine and calc_cloud_state side by side from random cloud layers.
+    The map sizes include widths that are not a multiple of 64 (so rows end inside a word) and
+    every map has edge rows and columns with fewer neighbours. Thresholds are fixed ints
+    (including values below 0 and above 4) or packed per-cell thresholds.
+
+    Returns:
+    - dict: {case: the number of cells whose cloud state differs, over all steps}.
+    """
+    import numpy as np
+    from map import MapGenerator
+    from grid_state import CLOUD_STATES
+    from calculations import calc_cloud_state
+    from cloud_engine import CloudEngine, unpack
+
+    def per_cell(packed, cols):
+        low, high = packed
+        return unpack(low, cols).astype(int) + 2 * unpack(high, cols).astype(int)
+
+    rng = np.random.default_rng(seed)
+    mismatches = {}
+    for size in sizes:
+        map_generator = MapGenerator(size)
+        initial = rng.integers(0, len(CLOUD_STATES), size=(size, size)).astype(np.uint8)
+        for thresholds in ((-1, 5), (0, 4), (1, 2), (2, 1), (3, 0), (4, -2), 'per-cell'):
+            engine = CloudEngine.from_codes(initial, seed=seed)
+            codes = initial
+            different = 0
+            for _ in range(steps):
+                if thresholds == 'per-cell':
+                    cloud_threshold, rain_threshold = engine.random_thresholds(), engine.random_thresholds()
+                    cloud_cells, rain_cells = per_cell(cloud_threshold, size), per_cell(rain_threshold, size)
+                else:
+                    cloud_threshold, rain_threshold = thresholds
+                    cloud_cells = np.full((size, size), cloud_threshold)
+                    rain_cells = np.full((size, size), rain_threshold)
+
+                for i, row in enumerate(map_generator.map):
+                    for j, cell in enumerate(row):
+                        cell.set_cloud(CLOUD_STATES[codes[i, j]])
+                expected = np.array([
+                    [CLOUD_STATES.index(calc_cloud_state(map_generator, cell, cloud_cells[i, j], rain_cells[i, j]))
+                     for j, cell in enumerate(row)]
+                    for i, row in enumerate(map_generator.map)
+                ])
+                engine.step(cloud_threshold, rain_threshold)
+                different += int(np.count_nonzero(engine.to_codes() != expected))
+                codes = expected  # Each side continues from its own generation
+            mismatches[f"{size}x{size}, thresholds {thresholds}"] = different
+    return mismatches
+
+def check_cloud_engine_divergence():
+    """
+    Check the packed cloud engine matches calc_cloud_state cell for cell.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    mismatches = measure_cloud_engine_divergence()
+    failed = {case: count for case, count in mismatches.items() if count}
+    print(f"cloud engine vs calc_cloud_state: {len(mismatches) - len(failed)} of {len(mismatches)} cases match")
+    return [f"cloud engine differs from calc_cloud_state in {count} cells ({case})" for case, count in failed.items()]
+
+def measure_frame_export(map_size=200, steps=50):
+    """
+    Time a headless run with and without exporting every generation as PNG frames.
+
+    Returns:
+    - dict: 'plain' (the stepping loop alone), 'loop' (the stepping loop while exporting),
+      'drain' (waiting for the last frames to be written after the loop) and 'submit'
+      (the mean time of one FrameExporter.submit call), in seconds.
+    """
+    import tempfile
+    import time
+    from grid_state import GridState
+    from frame_export import FrameExporter, record_run
+
+    class NoExport:
+        def submit(self, iteration, state):
+            pass
+
+    class TimedExporter(FrameExporter):
+        submit_seconds = 0.0
+        submits = 0
+
+        def submit(self, iteration, state):
+            start = time.perf_counter()
+            super().submit(iteration, state)
+            self.submit_seconds += time.perf_counter() - start
+            self.submits += 1
+
+    state = GridState.create(map_size)
+    start = time.perf_counter()
+    record_run(state, steps, NoExport(), seed=0)
+    plain_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        exporter = TimedExporter(directory, overlay='temp', value_range=(-20, 60))
+        start = time.perf_counter()
+        record_run(state, steps, exporter, seed=0)
+        loop_seconds = time.perf_counter() - start
+        exporter.close()
+        drain_seconds = time.perf_counter() - start - loop_seconds
+    return {
+        'plain': plain_seconds,
+        'loop': loop_seconds,
+        'drain': drain_seconds,
+        'submit': exporter.submit_seconds / exporter.submits,
+    }
+
+def check_frame_export(budget=FRAME_SUBMIT_BUDGET, map_size=200, steps=50):
+    """
+    Check FrameExporter.submit costs the stepping loop at most `budget` of a step.
+    Returns a list of failure messages (empty when all checks pass).
+    """
+    seconds = measure_frame_export(map_size, steps)
+    step_seconds = seconds['plain'] / steps
+    print(f"frame export ({steps} frames, {map_size}x{map_size}): loop {seconds['loop']:.2f} s "
+          f"vs {seconds['plain']:.2f} s without exporting, then {seconds['drain']:.2f} s writing the last frames; "
+          f"submit() {seconds['submit'] * 1e3:.2f} ms per frame ({seconds['submit'] / step_seconds:.0%} of a step)")
+    if seconds['submit'] > budget * step_seconds:
+        return [f"FrameExporter.submit takes {seconds['submit'] * 1e3:.2f} ms, more than {budget:.0%} "
+                f"of a {step_seconds * 1e3:.2f} ms step"]
+    return []
+
+def measure_region_index(map_size=500, steps=20, seed=0):
+    """
+    Time the region index against rescanning the grid, while a warming front melts glaciers.
+    Glacier temperatures start just below 0 (lowest in the east), so glacier cells turn into sea
+    every step and the index has to relabel the regions around them.
+
+    Returns:
+    - dict: Per step, 'changed_cells' (cells whose element changed), 'update_seconds' (relabeling),
+      'mean_seconds' and 'std_seconds' (querying the mean, or the mean and std, of every region
+      with the index), and 'rescan_seconds' (labeling the grid from scratch and computing the mean
+      and std of every region).
+    """
+    import time
+    import numpy as np
+    from grid_state import GridState
+    from grid_calculations import step_state, GLACIER
+    from region_index import RegionIndex, label_components
+
+    rng = np.random.default_rng(seed)
+    state = GridState.create(map_size)
+    glacier_rows, glacier_cols = np.nonzero(state.element == GLACIER)
+    state.temp[glacier_rows, glacier_cols] = -0.5 * glacier_cols / map_size
+    index = RegionIndex(state)
+    totals = dict.fromkeys(('changed_cells', 'update_seconds', 'mean_seconds', 'std_seconds', 'rescan_seconds'), 0)
+    for _ in range(steps):
+        previous_element = state.element
+        state = step_state(state, rng)
+        totals['changed_cells'] += int(np.count_nonzero(state.element != previous_element))
+
+        start = time.perf_counter()
+        index.update(state)
+        totals['update_seconds'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for label in index.regions():
+            index.region_stats(label, std=False)
+        totals['mean_seconds'] += time.perf_counter() - start
+
+        index.update(state)  # Drop the sums, so the std queries start from scratch too
+        start = time.perf_counter()
+        for label in index.regions():
+            index.region_stats(label)
+        totals['std_seconds'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        labels, count = label_components(state.element)
+        flat_labels, temp = labels.ravel(), state.temp.ravel()
+        counts = np.bincount(flat_labels, minlength=count)
+        means = np.bincount(flat_labels, temp, count) / counts
+        np.sqrt(np.maximum(np.bincount(flat_labels, temp ** 2, count) / counts - means ** 2, 0))
+        totals['rescan_seconds'] += time.perf_counter() - start
+    return {name: total / steps for name, total in totals.items()}
+
+def report_region_index(map_size=500, steps=20):
+    """Print the cost of per-region statistics with the region index and with rescans."""
+    report = measure_region_index(map_size, steps)
+    index_seconds = report['update_seconds'] + report['std_seconds']
+    print(f"region index ({map_size}x{map_size}, {report['changed_cells']:.0f} cells melting per step): "
+          f"relabel {report['update_seconds'] * 1000:.1f} ms + queries {report['mean_seconds'] * 1000:.2f} ms "
+          f"(mean) / {report['std_seconds'] * 1000:.2f} ms (mean and std) per step vs "
+          f"{report['rescan_seconds'] * 1000:.1f} ms rescanning ({report['rescan_seconds'] / index_seconds:.1f}x)")
+    return []
+
+if __name__ == "__main__":
+    failures = check_startup()
+    failures += check_rule_divergence()
+    failures += check_adaptive_stride()
+    failures += check_convergence()
+    failures += check_precision_drift()
+    failures += check_step_memory()
+    failures += check_streaming_memory()
+    failures += report_coarse_preview()
+    failures += check_cloud_engine_divergence()
+    failures += check_cloud_engine()
+    failures += check_frame_export()
+    failures += report_region_index()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
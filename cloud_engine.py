@@ -0,0 +1,137 @@
+"""
+Bit-packed engine for the cloud and rain cellular automaton.
+The 'cloud' and 'rain' states are stored as bit masks (64 cells per uint64 word, one row of
+words per map row), and the cloud neighbours of every cell are counted with shifted bitwise
+operations, applying the transitions of calc_cloud_state to 64 cells at a time.
+"""
+import numpy as np
+from grid_calculations import GLACIER, CLEAR, CLOUD, RAIN
+
+WORD_BITS = 64
+
+def pack(mask):
+    """Pack a 2D boolean mask into a (rows, words) uint64 array; column j is bit j % 64 of word j // 64."""
+    rows, cols = mask.shape
+    words = -(-cols // WORD_BITS)
+    padded = np.zeros((rows, words * WORD_BITS), dtype=bool)
+    padded[:, :cols] = mask
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').astype(np.uint64)
+
+def unpack(words, cols):
+    """Unpack a (rows, words) uint64 array back into a 2D boolean mask with `cols` columns."""
+    as_bytes = words.astype('<u8').view(np.uint8)
+    return np.unpackbits(as_bytes, axis=1, bitorder='little')[:, :cols].astype(bool)
+
+def shift_west(words):
+    """Each cell gets the bit of its west neighbour (column j - 1); column 0 gets 0."""
+    carry = np.zeros_like(words)
+    carry[:, 1:] = words[:, :-1] >> np.uint64(WORD_BITS - 1)
+    return (words << np.uint64(1)) | carry
+
+def shift_east(words):
+    """Each cell gets the bit of its east neighbour (column j + 1); the last column gets 0."""
+    carry = np.zeros_like(words)
+    carry[:, :-1] = words[:, 1:] << np.uint64(WORD_BITS - 1)
+    return (words >> np.uint64(1)) | carry
+
+def shift_north(words):
+    """Each cell gets the bit of its north neighbour (row i - 1); row 0 gets 0."""
+    shifted = np.zeros_like(words)
+    shifted[1:] = words[:-1]
+    return shifted
+
+def shift_south(words):
+    """Each cell gets the bit of its south neighbour (row i + 1); the last row gets 0."""
+    shifted = np.zeros_like(words)
+    shifted[:-1] = words[1:]
+    return shifted
+
+def at_least(neighbors):
+    """
+    Given the four neighbour masks, return the masks of cells with at least 0, 1, 2, 3 and 4
+    neighbours set (index = count).
+    """
+    a, b, c, d = neighbors
+    ones = np.full_like(a, np.uint64(0xFFFFFFFFFFFFFFFF))
+    return (
+        ones,
+        a | b | c | d,
+        (a & b) | (a & c) | (a & d) | (b & c) | (b & d) | (c & d),
+        (a & b & c) | (a & b & d) | (a & c & d) | (b & c & d),
+        a & b & c & d,
+    )
+
+def meets_threshold(counts, threshold):
+    """
+    Mask of cells whose neighbour count is at least `threshold`.
+    `threshold` is either an int (any value: below 0 every cell meets it, above 4 none does),
+    or a (low_bit, high_bit) pair of packed masks holding a per-cell threshold between 0 and 3.
+    """
+    if isinstance(threshold, (int, np.integer)):
+        return counts[max(threshold, 0)] if threshold <= 4 else np.zeros_like(counts[0])
+    low, high = threshold
+    return ((~high & ~low & counts[0]) | (~high & low & counts[1]) |
+            (high & ~low & counts[2]) | (high & low & counts[3]))
+
+
+class CloudEngine:
+    """
+    The cloud layer of a map, as two packed masks (cloud and rain).
+
+    Every step applies the rules of calc_cloud_state:
+    - Rain becomes clear skies.
+    - A cloud with at least `rain_threshold` cloud neighbours becomes rain, otherwise stays a cloud.
+    - Clear skies with at least `cloud_threshold` cloud neighbours become a cloud.
+    """
+
+    def __init__(self, rows, cols, seed=None):
+        self.rows = rows
+        self.cols = cols
+        self.words = -(-cols // WORD_BITS)
+        self.cloud = np.zeros((rows, self.words), dtype=np.uint64)
+        self.rain = np.zeros((rows, self.words), dtype=np.uint64)
+        self.rng = np.random.default_rng(seed)
+        # Padding bits past the last column must stay 0, so they never count as clouds
+        self.valid = pack(np.ones((1, cols), dtype=bool))
+
+    @classmethod
+    def from_codes(cls, clouds, seed=None):
+        """Create an engine from a 2D array of cloud codes (see grid_state.CLOUD_STATES)."""
+        engine = cls(*clouds.shape, seed=seed)
+        engine.cloud = pack(clouds == CLOUD)
+        engine.rain = pack(clouds == RAIN)
+        return engine
+
+    def to_codes(self, dtype=np.uint8):
+        """Return the cloud layer as a 2D array of cloud codes."""
+        codes = np.full((self.rows, self.cols), CLEAR, dtype=dtype)
+        codes[unpack(self.cloud, self.cols)] = CLOUD
+        codes[unpack(self.rain, self.cols)] = RAIN
+        return codes
+
+    def seed_glaciers(self, element):
+        """Add a cloud to every clear glacier cell. Called once, before the first step."""
+        glaciers = pack(element == GLACIER)
+        self.cloud |= glaciers & ~self.rain
+
+    def random_thresholds(self):
+        """Draw a packed per-cell threshold between 0 and 3 (two uniform random bits per cell)."""
+        low = self.rng.integers(0, 2 ** 64, size=self.cloud.shape, dtype=np.uint64)
+        high = self.rng.integers(0, 2 ** 64, size=self.cloud.shape, dtype=np.uint64)
+        return low, high
+
+    def step(self, cloud_threshold=None, rain_threshold=None):
+        """
+        Advance the cloud layer by one generation.
+        Thresholds are ints (the same for every cell), packed (low_bit, high_bit) masks, or
+        None to draw a random threshold between 0 and 3 for every cell (as SimulationApp does).
+        """
+        cloud_threshold = self.random_thresholds() if cloud_threshold is None else cloud_threshold
+        rain_threshold = self.random_thresholds() if rain_threshold is None else rain_threshold
+
+        counts = at_least((shift_north(self.cloud), shift_south(self.cloud),
+                           shift_west(self.cloud), shift_east(self.cloud)))
+        clear = ~(self.cloud | self.rain) & self.valid
+        becomes_rain = self.cloud & meets_threshold(counts, rain_threshold)
+        self.cloud = (self.cloud & ~becomes_rain) | (clear & meets_threshold(counts, cloud_threshold))
+        self.rain = becomes_rain
@@ -0,0 +1,157 @@
+"""
+Coarse-grained preview of a simulation.
+The map is aggregated into blocks of factor x factor cells, simulated at that lower
+resolution, and upsampled back to the full resolution. Hotspot blocks of the preview can then
+be refined by simulating only their neighbourhood at full resolution.
+"""
+import numpy as np
+from grid_state import GridState, ELEMENTS, WIND_DIRECTIONS, CLOUD_STATES, FIELDS
+from grid_calculations import step_state, step_rows, global_averages
+
+# Fields aggregated by majority vote; the other fields use the block mean
+MAJORITY_FIELDS = {'element': len(ELEMENTS), 'wind_direction': len(WIND_DIRECTIONS), 'clouds': len(CLOUD_STATES)}
+
+def blocks(values, factor):
+    """View a (size, size) array as (size // factor, size // factor, factor * factor) blocks."""
+    size = values.shape[0] // factor
+    return values.reshape(size, factor, size, factor).swapaxes(1, 2).reshape(size, size, factor * factor)
+
+def majority(values, factor, num_codes):
+    """The most common code of every block (ties go to the lowest code)."""
+    block_values = blocks(values, factor)
+    counts = np.stack([np.count_nonzero(block_values == code, axis=2) for code in range(num_codes)])
+    return np.argmax(counts, axis=0).astype(values.dtype)
+
+def coarsen_state(state, factor):
+    """
+    Aggregate a state into blocks of factor x factor cells.
+    Element, wind direction and clouds take the majority of the block, the other attributes its mean.
+
+    Returns:
+    - GridState: A (size // factor) x (size // factor) state with the same dtypes.
+    """
+    if factor < 1 or state.size % factor != 0:
+        raise ValueError(f"Map size {state.size} must be divisible by the coarsening factor {factor}.")
+    coarse = GridState(state.size // factor, allocate=False)
+    coarse.dtypes = dict(state.dtypes)
+    for field in FIELDS:
+        values = getattr(state, field)
+        if field in MAJORITY_FIELDS:
+            setattr(coarse, field, majority(values, factor, MAJORITY_FIELDS[field]))
+        else:
+            setattr(coarse, field, blocks(values, factor).mean(axis=2, dtype=np.float64).astype(values.dtype))
+    return coarse
+
+def coarsen_generator(map_generator, factor, precision='float64'):
+    """Aggregate the map of a MapGenerator into a coarse state."""
+    return coarsen_state(GridState.from_map(map_generator.map, precision), factor)
+
+def upsample_state(coarse, factor):
+    """Upsample a coarse state back to full resolution (every cell takes the value of its block)."""
+    fine = GridState(coarse.size * factor, allocate=False)
+    fine.dtypes = dict(coarse.dtypes)
+    for field in FIELDS:
+        setattr(fine, field, np.repeat(np.repeat(getattr(coarse, field), factor, axis=0), factor, axis=1))
+    return fine
+
+def run_preview(state, factor, steps, seed=None):
+    """
+    Simulate a coarse version of the state.
+
+    Returns:
+    - (preview, global_history): the upsampled final state and the (average temperature,
+      average pollution) of the coarse map before every step.
+    """
+    rng = np.random.default_rng(seed)
+    coarse = coarsen_state(state, factor)
+    global_history = []
+    for _ in range(steps):
+        global_history.append(global_averages(coarse))
+        coarse = step_state(coarse, rng)
+    return upsample_state(coarse, factor), global_history
+
+def find_hotspots(preview, factor, field='temp', quantile=0.95):
+    """
+    Find the blocks of a preview whose `field` is at or above the given quantile.
+
+    Returns:
+    - np.ndarray: A (size // factor, size // factor) boolean mask of hotspot blocks.
+    """
+    block_values = getattr(preview, field)[::factor, ::factor]
+    return block_values >= np.quantile(block_values, quantile)
+
+def mixed_blocks(state, factor):
+    """
+    Find the blocks of a state that hold more than one element.
+    The preview gives such a block the element of its majority, so these are the blocks
+    where it is least accurate (see benchmarks.measure_coarse_preview).
+
+    Returns:
+    - np.ndarray: A (size // factor, size // factor) boolean mask of mixed blocks.
+    """
+    block_elements = blocks(state.element, factor)
+    return np.any(block_elements != block_elements[..., :1], axis=2)
+
+def refine_hotspots(state, preview, global_history, hotspots, factor, margin=2, seed=None):
+    """
+    Re-simulate the hotspot blocks of a preview at full resolution.
+
+    Every hotspot block is simulated in its own window, the block plus `margin` surrounding
+    cells (shifted inwards at the map edge), using the global averages of the coarse run. All
+    windows are stacked and stepped together, so the cost grows with the number of blocks, not
+    with the area around them. Changes propagate one cell per step, so the window edge does reach
+    the block in long runs; the neighbour averaging damps it quickly (see benchmarks.py).
+
+    Args:
+    state (GridState): The full resolution state the preview was started from.
+    preview (GridState): The upsampled result of run_preview (updated in place).
+    global_history (list): The global averages returned by run_preview.
+    hotspots (np.ndarray): Boolean mask of the blocks to refine (see find_hotspots and mixed_blocks).
+    factor (int): The coarsening factor of the preview.
+    margin (int): The number of cells simulated around every block.
+    seed (int): Seed for the random cloud and rain thresholds.
+
+    Returns:
+    - GridState: The preview with the refined hotspots.
+    """
+    window = factor + 2 * margin
+    if window > state.size:
+        raise ValueError(f"Window of {window} cells does not fit a map of size {state.size}.")
+    block_rows, block_cols = np.nonzero(hotspots)
+    if len(block_rows) == 0:
+        return preview
+    tops, lefts = block_rows * factor, block_cols * factor
+    row_starts = np.clip(tops - margin, 0, state.size - window)
+    col_starts = np.clip(lefts - margin, 0, state.size - window)
+
+    rng = np.random.default_rng(seed)
+    windows = window_stack(state, row_starts, col_starts, window)
+    next_windows = window_stack(state, row_starts, col_starts, window)
+    for global_temp, global_pollution in global_history:
+        step_rows(windows, next_windows, 0, window, global_temp, global_pollution, rng)
+        windows, next_windows = next_windows, windows
+
+    offsets = np.arange(factor)
+    rows = (tops - row_starts)[:, None] + offsets  # Block rows inside every window
+    cols = (lefts - col_starts)[:, None] + offsets
+    fine_rows = (tops[:, None] + offsets)[:, :, None]
+    fine_cols = (lefts[:, None] + offsets)[:, None, :]
+    index = np.arange(len(tops))[:, None, None]
+    for field in FIELDS:
+        values = getattr(windows, field)
+        getattr(preview, field)[fine_rows, fine_cols] = values[rows[:, :, None], index, cols[:, None, :]]
+    return preview
+
+def window_stack(state, row_starts, col_starts, window):
+    """
+    Copy square windows of a state into one state whose arrays are (window, windows, window)
+    stacks; step_rows steps them together and treats every window border as the map edge.
+    """
+    stack = GridState(window, allocate=False)
+    stack.dtypes = dict(state.dtypes)
+    offsets = np.arange(window)
+    rows = (row_starts[:, None] + offsets).T[:, :, None]
+    cols = (col_starts[:, None] + offsets)[None, :, :]
+    for field in FIELDS:
+        setattr(stack, field, getattr(state, field)[rows, cols])
+    return stack
@@ -0,0 +1,300 @@
+"""
+Headless export of simulation runs to image frames.
+Generations are rendered from the state arrays with the CELL_COLORS palette (optionally with a
+temperature or pollution heatmap on top) and encoded on a background thread pool, so the
+stepping loop only pays for copying the arrays it needs. Animations are appended to frame by
+frame by a single writer thread, so no more than a bounded number of frames is ever in memory.
+Requires Pillow (installed with matplotlib).
+"""
+import io
+import os
+import queue
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from grid_state import ELEMENTS
+from grid_calculations import step_state
+from simulation import CELL_COLORS
+
+FORMATS = ('png', 'gif', 'apng')  # 'png' writes one file per frame, the others one animation
+OVERLAYS = ('temp', 'pollution')
+
+# Heatmap colour of the lowest and highest value of the overlay range
+HEATMAP_LOW = np.array([0, 0, 255], dtype=np.float32)
+HEATMAP_HIGH = np.array([255, 0, 0], dtype=np.float32)
+
+def element_palette():
+    """RGB colour of every element code, from CELL_COLORS."""
+    from PIL import ImageColor
+    return np.array([ImageColor.getrgb(CELL_COLORS[element]) for element in ELEMENTS], dtype=np.uint8)
+
+def render_frame(element, palette, cell_size=1, overlay=None, value_range=None, overlay_alpha=0.5):
+    """
+    Render one generation to an RGB array.
+
+    Args:
+    element (np.ndarray): 2D array of element codes.
+    palette (np.ndarray): RGB colour of every element code (see element_palette).
+    cell_size (int): The number of pixels per cell on each side.
+    overlay (np.ndarray): Optional 2D array of values drawn as a heatmap on top of the elements.
+    value_range (tuple): The (low, high) overlay values mapped to the ends of the heatmap.
+    overlay_alpha (float): Opacity of the heatmap.
+
+    Returns:
+    - np.ndarray: A (rows * cell_size, cols * cell_size, 3) uint8 image.
+    """
+    image = palette[element].astype(np.float32)
+    if overlay is not None:
+        low, high = value_range
+        level = np.clip((overlay - low) / ((high - low) or 1), 0, 1)[..., None]
+        heatmap = HEATMAP_LOW + level * (HEATMAP_HIGH - HEATMAP_LOW)
+        image = (1 - overlay_alpha) * image + overlay_alpha * heatmap
+    image = image.astype(np.uint8)
+    if cell_size > 1:
+        image = np.repeat(np.repeat(image, cell_size, axis=0), cell_size, axis=1)
+    return image
+
+
+def png_chunks(data):
+    """Split PNG file data into a list of (chunk type, chunk data) pairs."""
+    chunks = []
+    position = 8  # After the PNG signature
+    while position < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[position:position + 8])
+        chunks.append((chunk_type, data[position + 8:position + 8 + length]))
+        position += 12 + length
+    return chunks
+
+def png_chunk(chunk_type, data):
+    """Encode one PNG chunk (length, type, data and CRC)."""
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+def encode_gif_frame(image, duration):
+    """
+    Encode an RGB image as one GIF frame with its own colour table.
+
+    Returns:
+    - (header, frame): the GIF header for an animation of this size (used with the first
+      frame only) and the frame data.
+    """
+    from PIL import GifImagePlugin
+    frame = image.quantize()
+    header, _ = GifImagePlugin.getheader(frame.copy(), info={'loop': 0, 'duration': duration})
+    data = GifImagePlugin.getdata(frame, duration=duration, include_color_table=True)
+    return b"".join(header), b"".join(data)
+
+def encode_apng_frame(image):
+    """
+    Encode an RGB image as PNG.
+
+    Returns:
+    - (ihdr, idat): the IHDR chunk data and the concatenated IDAT chunk data.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    chunks = png_chunks(buffer.getvalue())
+    return chunks[0][1], b"".join(data for chunk_type, data in chunks if chunk_type == b"IDAT")
+
+
+class GifWriter:
+    """Appends frames encoded by encode_gif_frame to an animated GIF file."""
+
+    def __init__(self, file):
+        self.file = file
+        self.frames = 0
+
+    def write(self, frame):
+        header, data = frame
+        if self.frames == 0:
+            self.file.write(header)
+        self.file.write(data)
+        self.frames += 1
+
+    def close(self):
+        if self.frames:
+            self.file.write(b";")  # GIF trailer
+
+
+class ApngWriter:
+    """
+    Appends frames encoded by encode_apng_frame to an animated PNG file.
+    The number of frames is written into the acTL chunk when the writer is closed.
+    """
+
+    def __init__(self, file, frame_duration):
+        self.file = file
+        self.frame_duration = frame_duration
+        self.frames = 0
+        self.sequence = 0  # Sequence number of the next fcTL or fdAT chunk
+        self.actl_offset = None
+
+    def write(self, frame):
+        ihdr, idat = frame
+        if self.frames == 0:
+            self.file.write(b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", ihdr))
+            self.actl_offset = self.file.tell()
+            self.file.write(png_chunk(b"acTL", struct.pack(">II", 0, 0)))
+        width, height = struct.unpack(">II", ihdr[:8])
+        self.file.write(png_chunk(b"fcTL", struct.pack(
+            ">IIIIIHHBB", self.sequence, width, height, 0, 0, self.frame_duration, 1000, 0, 0
+        )))
+        self.sequence += 1
+        if self.frames == 0:
+            self.file.write(png_chunk(b"IDAT", idat))  # The first frame is also the default image
+        else:
+            self.file.write(png_chunk(b"fdAT", struct.pack(">I", self.sequence) + idat))
+            self.sequence += 1
+        self.frames += 1
+
+    def close(self):
+        if self.frames:
+            self.file.write(png_chunk(b"IEND", b""))
+            self.file.seek(self.actl_offset)
+            self.file.write(png_chunk(b"acTL", struct.pack(">II", self.frames, 0)))
+
+
+class FrameExporter:
+    """
+    Records every k-th generation of a run as image frames.
+
+    submit() copies the arrays a frame needs and hands them to a thread pool that renders and
+    encodes them. For animations, a single writer thread appends the encoded frames to the file
+    in submission order. At most `queue_size` frames are held at a time (waiting for a worker,
+    being encoded, or waiting for the writer); when that many are pending, submit() blocks until
+    one is written, which bounds the memory used by the export.
+    """
+
+    def __init__(self, output, format='png', every=1, cell_size=4, overlay=None, value_range=None,
+                 overlay_alpha=0.5, workers=None, queue_size=8, frame_duration=100):
+        """
+        Args:
+        output (str): A directory for 'png' frames, or the animation file for 'gif' and 'apng'.
+        format (str): One of FORMATS.
+        every (int): Export every k-th generation.
+        cell_size (int): The number of pixels per cell on each side.
+        overlay (str): Optional heatmap drawn on top of the elements, one of OVERLAYS.
+        value_range (tuple): The (low, high) overlay values mapped to the ends of the heatmap,
+            shared by all frames. Required with an overlay: temperature and pollution drift
+            during a run, so no single frame gives a range that fits the others.
+        overlay_alpha (float): Opacity of the heatmap.
+        workers (int): The number of encoding threads (defaults to 2, or 1 on a single core,
+            where a second worker only adds thread switches to every submit()).
+        queue_size (int): The largest number of frames held at a time.
+        frame_duration (int): Milliseconds per frame of an animation.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}', expected one of {FORMATS}.")
+        if overlay is not None and overlay not in OVERLAYS:
+            raise ValueError(f"Unknown overlay '{overlay}', expected one of {OVERLAYS}.")
+        if overlay is not None and value_range is None:
+            raise ValueError("An overlay needs an explicit value_range.")
+        if every < 1:
+            raise ValueError("Every must be 1 or greater.")
+
+        self.output = output
+        self.format = format
+        self.every = every
+        self.cell_size = cell_size
+        self.overlay = overlay
+        self.value_range = value_range
+        self.overlay_alpha = overlay_alpha
+        self.frame_duration = frame_duration
+        self.palette = element_palette()
+        self.futures = []  # 'png' frames being encoded
+        self.error = None  # First error raised while writing the animation
+        self.pending = threading.BoundedSemaphore(queue_size)
+        workers = workers or min(2, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-export")
+        self.encoded = queue.Queue()  # Futures of animation frames, in submission order
+        self.writer = None
+        if format == 'png':
+            os.makedirs(output, exist_ok=True)
+        else:
+            file = open(output, 'wb')
+            self.writer = threading.Thread(
+                target=self.write_animation, args=(file,), name="frame-export-writer", daemon=True
+            )
+            self.writer.start()
+
+    def submit(self, iteration, state):
+        """Queue the generation `iteration` of a GridState, if it is one of the exported generations."""
+        if iteration % self.every != 0:
+            return
+        overlay = getattr(state, self.overlay).copy() if self.overlay else None
+        self.pending.acquire()
+        future = self.executor.submit(self.encode, iteration, state.element.copy(), overlay)
+        if self.format == 'png':
+            future.add_done_callback(lambda _: self.pending.release())
+            self.futures.append(future)
+        else:
+            self.encoded.put(future)
+
+    def encode(self, iteration, element, overlay):
+        """Render a frame and write it (or encode it for the animation). Runs on a worker thread."""
+        from PIL import Image
+        image = Image.fromarray(render_frame(element, self.palette, 1, overlay, self.value_range, self.overlay_alpha))
+        if self.cell_size > 1:
+            # Pillow scales the frame up faster than np.repeat, with the same pixels
+            image = image.resize((image.width * self.cell_size, image.height * self.cell_size), Image.NEAREST)
+        if self.format == 'png':
+            # Fast compression keeps the workers ahead of the stepping loop
+            image.save(os.path.join(self.output, f"frame_{iteration:06d}.png"), compress_level=1)
+        elif self.format == 'gif':
+            return encode_gif_frame(image, self.frame_duration)
+        else:
+            return encode_apng_frame(image)
+
+    def write_animation(self, file):
+        """Append the encoded frames to the animation file in submission order. Runs on the writer thread."""
+        with file:
+            writer = GifWriter(file) if self.format == 'gif' else ApngWriter(file, self.frame_duration)
+            while True:
+                future = self.encoded.get()
+                if future is None:
+                    break
+                try:
+                    frame = future.result()
+                    if self.error is None:
+                        writer.write(frame)
+                except Exception as error:
+                    self.error = self.error or error
+                finally:
+                    self.pending.release()
+            writer.close()
+
+    def close(self):
+        """Wait for the queued frames to be written and finish the animation (for 'gif' and 'apng')."""
+        if self.writer is not None:
+            self.encoded.put(None)
+            self.writer.join()
+            self.writer = None
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            future.result()  # Raise the first encoding error, if any
+        self.futures = []
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def record_run(state, steps, exporter, seed=None):
+    """
+    Run `steps` generations of a GridState without a display and export them.
+    Generation 0 (the initial state) is exported as well.
+
+    Returns:
+    - GridState: The final generation.
+    """
+    rng = np.random.default_rng(seed)
+    exporter.submit(0, state)
+    for iteration in range(1, steps + 1):
+        state = step_state(state, rng)
+        exporter.submit(iteration, state)
+    return state
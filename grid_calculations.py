@@ -0,0 +1,230 @@
+"""
+Vectorised version of the rules in calculations.py, operating on a GridState.
+Every function applies the same formulas as its per-cell counterpart to whole rows at once,
+in the dtype of the state arrays (so a float32 state is also computed in float32).
+"""
+import numpy as np
+from calculations import (
+    TEMP_WEIGHTS_FOR_GLACIERS,
+    TEMP_WEIGHTS_FOR_CITY,
+    TEMP_WEIGHTS_FOR_ELSE,
+    POLLUTION_WEIGHTS,
+    WIND_MODIFIER_MAP,
+    SCALING_FACTOR,
+    CLOUD_EFFECTS,
+    DAMPENING_FACTOR
+)
+from grid_state import ELEMENTS, WIND_DIRECTIONS, CLOUD_STATES, FIELDS, INITIAL_VALUES, STEP_BAND_ROWS, GridState
+
+SEA, FOREST, LAND, CITY, GLACIER = (ELEMENTS.index(name) for name in ('sea', 'forest', 'land', 'city', 'glacier'))
+NORTH, SOUTH, EAST, WEST = (WIND_DIRECTIONS.index(name) for name in ('N', 'S', 'E', 'W'))
+CLEAR, CLOUD, RAIN = (CLOUD_STATES.index(name) for name in ('', 'cloud', 'rain'))
+
+# Temperature weights indexed by element code
+TEMP_WEIGHTS = {
+    weight: np.array([
+        TEMP_WEIGHTS_FOR_GLACIERS[weight] if element == 'glacier' else
+        TEMP_WEIGHTS_FOR_CITY[weight] if element == 'city' else
+        TEMP_WEIGHTS_FOR_ELSE[weight]
+        for element in ELEMENTS
+    ])
+    for weight in ('alpha', 'beta', 'gamma', 'delta')
+}
+WIND_MODIFIERS = np.array([WIND_MODIFIER_MAP[element] for element in ELEMENTS])
+CLOUD_EFFECT_VALUES = np.array([CLOUD_EFFECTS[state] for state in CLOUD_STATES])
+
+# The four neighbours in the order of MapGenerator.get_neighbors: (row offset, column offset)
+NEIGHBOR_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+# Wind direction a neighbour must have to blow towards the cell (see filter_neighbors_by_wind)
+WIND_TOWARDS_CELL = (EAST, WEST, NORTH, SOUTH)
+# Wind direction assigned when a neighbour has the largest temperature difference (see calc_wind_direction)
+WIND_FROM_NEIGHBOR = (EAST, WEST, SOUTH, NORTH)
+
+def shift(values, row_offset, col_offset, fill=0):
+    """
+    Return an array where position (i, j) holds values[i + row_offset, j + col_offset],
+    and `fill` where that position is outside the array.
+    Rows are the first axis and columns the last, so a (rows, windows, cols) stack of
+    equally sized windows is shifted window by window.
+    """
+    shifted = np.full_like(values, fill)
+    rows, cols = values.shape[0], values.shape[-1]
+    dst_rows = slice(max(-row_offset, 0), rows - max(row_offset, 0))
+    dst_cols = slice(max(-col_offset, 0), cols - max(col_offset, 0))
+    src_rows = slice(max(row_offset, 0), rows - max(-row_offset, 0))
+    src_cols = slice(max(col_offset, 0), cols - max(-col_offset, 0))
+    shifted[dst_rows, ..., dst_cols] = values[src_rows, ..., src_cols]
+    return shifted
+
+def global_averages(state, band_rows=None):
+    """
+    Calculate the global average temperature and pollution of a state.
+    With `band_rows` the sums are accumulated band by band, so memory-mapped states are
+    reduced without loading them whole.
+    """
+    band_rows = band_rows or state.size
+    total_temp = 0.0
+    total_pollution = 0.0
+    for start in range(0, state.size, band_rows):
+        stop = min(start + band_rows, state.size)
+        total_temp += float(np.sum(state.temp[start:stop], dtype=np.float64))
+        total_pollution += float(np.sum(state.pollution[start:stop], dtype=np.float64))
+    num_cells = state.size ** 2
+    return total_temp / num_cells, total_pollution / num_cells
+
+def step_rows(state, next_state, start, stop, global_temp, global_pollution,
+              rng=None, neighbors=None, cloud_thresholds=None, rain_thresholds=None):
+    """
+    Compute rows [start, stop) of the next generation and write them into next_state.
+    Only rows [start - 1, stop + 1) of the current state are read.
+
+    Args:
+    state (GridState): The current generation.
+    next_state (GridState): Where the next generation rows are written.
+    global_temp, global_pollution (float): Global averages of the current generation.
+    rng (np.random.Generator): Used to draw the random cloud and rain thresholds (0-3).
+    neighbors (GridState): Optional state the neighbour values are read from (defaults to `state`).
+    cloud_thresholds, rain_thresholds (np.ndarray): Optional thresholds for rows [start, stop),
+        instead of drawing them from `rng`.
+    """
+    neighbors = state if neighbors is None else neighbors
+    rng = np.random.default_rng() if rng is None else rng
+    low, high = max(start - 1, 0), min(stop + 1, state.size)
+    rows = slice(start - low, stop - low)  # Rows of the band inside the block read with its halo
+
+    def block(source, field):
+        return getattr(source, field)[low:high]
+
+    element = block(state, 'element')[rows]
+    temp = block(state, 'temp')
+    pollution = block(state, 'pollution')
+    wind_speed = block(state, 'wind_speed')[rows]
+    clouds = block(state, 'clouds')[rows]
+    neighbor_temp = block(neighbors, 'temp')
+    neighbor_pollution = block(neighbors, 'pollution')
+    neighbor_direction = block(neighbors, 'wind_direction')
+    neighbor_is_cloud = block(neighbors, 'clouds') == CLOUD
+    valid = np.ones(temp.shape, dtype=bool)
+
+    cell_temp = temp[rows]
+    cell_pollution = pollution[rows]
+    dtype = cell_temp.dtype  # Lookup tables are cast so the arithmetic stays in the state precision
+    neighbor_count = np.zeros(cell_temp.shape, dtype=np.int8)
+    temp_sum = np.zeros_like(cell_temp)
+    pollution_sum = np.zeros_like(cell_pollution)
+    wind_temp = np.zeros_like(cell_temp)
+    wind_pollution = np.zeros_like(cell_pollution)
+    squared_diff = np.zeros_like(cell_temp)
+    cloud_neighbors = np.zeros(cell_temp.shape, dtype=np.int8)
+    max_diff = np.full_like(cell_temp, -1)
+    next_direction = np.zeros(cell_temp.shape, dtype=next_state.wind_direction.dtype)
+
+    for (row_offset, col_offset), towards, direction in zip(NEIGHBOR_OFFSETS, WIND_TOWARDS_CELL, WIND_FROM_NEIGHBOR):
+        exists = shift(valid, row_offset, col_offset, False)[rows]
+        n_temp = shift(neighbor_temp, row_offset, col_offset)[rows]
+        n_pollution = shift(neighbor_pollution, row_offset, col_offset)[rows]
+        blows = exists & (shift(neighbor_direction, row_offset, col_offset)[rows] == towards)
+        temp_diff = np.abs(cell_temp - n_temp)
+
+        neighbor_count += exists
+        temp_sum += np.where(exists, n_temp, 0)
+        pollution_sum += np.where(exists, n_pollution, 0)
+        wind_temp += np.where(blows, wind_speed * temp_diff, 0)
+        wind_pollution += np.where(blows, wind_speed * (n_pollution - cell_pollution), 0)
+        squared_diff += np.where(exists, temp_diff ** 2, 0)
+        cloud_neighbors += exists & shift(neighbor_is_cloud, row_offset, col_offset, False)[rows]
+
+        # Strictly larger difference wins, so ties keep the first neighbour (as calc_wind_direction)
+        larger = exists & (temp_diff > max_diff)
+        max_diff = np.where(larger, temp_diff, max_diff)
+        next_direction = np.where(larger, direction, next_direction)
+
+    # calc_temp
+    temp_avg = temp_sum / neighbor_count
+    baseline_temp_growth = np.abs(cell_temp - global_temp) * 0.1
+    raw_new_temp = (TEMP_WEIGHTS['alpha'].astype(dtype)[element] * cell_temp +
+                    TEMP_WEIGHTS['beta'].astype(dtype)[element] * temp_avg +
+                    TEMP_WEIGHTS['gamma'].astype(dtype)[element] * cell_pollution +
+                    TEMP_WEIGHTS['delta'].astype(dtype)[element] * wind_temp +
+                    baseline_temp_growth +
+                    CLOUD_EFFECT_VALUES.astype(dtype)[clouds])
+    new_temp = cell_temp + DAMPENING_FACTOR['temp_dampening'] * (np.abs(raw_new_temp - cell_temp) * 0.1 * global_pollution)
+    new_temp = np.maximum(new_temp, cell_temp)
+
+    # calc_pollution
+    pollution_avg = pollution_sum / neighbor_count
+    precipitation_effect = np.where(clouds == RAIN, CLOUD_EFFECTS['rain'], 0).astype(dtype)
+    based_growth_pollution = np.floor_divide(np.abs(cell_pollution - global_pollution), 0.02) * cell_pollution
+    raw_new_pollution = (POLLUTION_WEIGHTS['alpha'] * cell_pollution +
+                         POLLUTION_WEIGHTS['beta'] * pollution_avg +
+                         block(state, 'gen_pollution')[rows] -
+                         block(state, 'absorb_pollution')[rows] +
+                         wind_pollution +
+                         precipitation_effect +
+                         based_growth_pollution)
+    new_pollution = cell_pollution + DAMPENING_FACTOR['pollution_dampening'] * (
+        np.abs(raw_new_pollution - cell_pollution) * 0.05 * global_pollution)
+    new_pollution = np.maximum(cell_pollution, new_pollution)
+
+    # calc_cloud_state
+    if cloud_thresholds is None:
+        cloud_thresholds = rng.integers(0, 4, size=cell_temp.shape, dtype=np.int8)
+    if rain_thresholds is None:
+        rain_thresholds = rng.integers(0, 4, size=cell_temp.shape, dtype=np.int8)
+    new_clouds = np.where(
+        clouds == RAIN, CLEAR,
+        np.where(clouds == CLOUD,
+                 np.where(cloud_neighbors >= rain_thresholds, RAIN, CLOUD),
+                 np.where(cloud_neighbors >= cloud_thresholds, CLOUD, CLEAR))
+    )
+
+    # calc_wind_speed
+    new_wind_speed = np.clip(SCALING_FACTOR * np.sqrt(squared_diff) * WIND_MODIFIERS.astype(dtype)[element], 0.1, 5.0)
+
+    # check_and_update_cell_type
+    new_element = element.copy()
+    new_element[(element == FOREST) & (new_temp > 40)] = LAND
+    new_element[(element == GLACIER) & (new_temp >= 0)] = SEA
+    new_element[(element == SEA) & (new_temp < 0)] = GLACIER
+    new_element[(element == CITY) & (new_temp > 50)] = LAND
+
+    # The next cell is created from the current element, then increase_get_pollution runs on the updated type
+    new_gen_pollution = INITIAL_VALUES['gen_pollution'][element] + np.where(new_element == CITY, 0.1, 0)
+    new_absorb_pollution = INITIAL_VALUES['absorb_pollution'][element]
+
+    next_state.temp[start:stop] = new_temp
+    next_state.pollution[start:stop] = new_pollution
+    next_state.clouds[start:stop] = new_clouds
+    next_state.wind_speed[start:stop] = new_wind_speed
+    next_state.wind_direction[start:stop] = next_direction
+    next_state.element[start:stop] = new_element
+    next_state.gen_pollution[start:stop] = new_gen_pollution
+    next_state.absorb_pollution[start:stop] = new_absorb_pollution
+
+def step_state(state, rng=None, neighbors=None, next_state=None, band_rows=STEP_BAND_ROWS):
+    """
+    Compute the next generation of a state (the array equivalent of next_generation).
+    Rows are computed in bands of `band_rows`, so the temporaries of step_rows stay bounded
+    by the band size (see grid_state.estimate_memory).
+
+    SimulationApp reads neighbour values from the MapGenerator grid, which keeps the first
+    generation; pass that state as `neighbors` to reproduce it exactly.
+
+    Returns:
+    - GridState: The next generation, with the same dtypes as `state`.
+    """
+    if next_state is None:
+        next_state = GridState(state.size, allocate=False)
+        next_state.dtypes = dict(state.dtypes)
+        for field in FIELDS:
+            setattr(next_state, field, np.empty((state.size, state.size), dtype=state.dtypes[field]))
+    rng = np.random.default_rng() if rng is None else rng
+    global_temp, global_pollution = global_averages(state, band_rows)
+    for start in range(0, state.size, band_rows):
+        stop = min(start + band_rows, state.size)
+        step_rows(state, next_state, start, stop, global_temp, global_pollution, rng, neighbors)
+    return next_state
+
+def add_clouds_to_glaciers_state(state):
+    """Add clouds to every clear glacier cell (the array version of add_clouds_to_glaciers)."""
+    state.clouds[(state.element == GLACIER) & (state.clouds == CLEAR)] = CLOUD
@@ -0,0 +1,210 @@
+"""
+Array storage for the simulation state.
+Instead of one Cell object per position, every attribute is stored as a 2D array with a
+configurable dtype, so large grids can be kept in a fraction of the memory.
+Strings (element, wind direction, clouds) are stored as small integer codes.
+"""
+import numpy as np
+from Cell import Cell
+
+ELEMENTS = tuple(Cell.ELEMENT_ATTRIBUTES)  # Code of an element is its index in this tuple
+WIND_DIRECTIONS = ('N', 'S', 'E', 'W')
+CLOUD_STATES = ('', 'cloud', 'rain')
+
+FLOAT_FIELDS = ('temp', 'pollution', 'wind_speed', 'gen_pollution', 'absorb_pollution')
+CODE_FIELDS = ('element', 'wind_direction', 'clouds')
+FIELDS = FLOAT_FIELDS + CODE_FIELDS
+
+PRECISION_MODES = {
+    # Same precision as the Cell based simulation
+    'float64': {
+        'temp': np.float64, 'pollution': np.float64, 'wind_speed': np.float64,
+        'gen_pollution': np.float64, 'absorb_pollution': np.float64,
+        'element': np.uint8, 'wind_direction': np.uint8, 'clouds': np.uint8
+    },
+    # Reduced precision for huge grids (23 bytes per cell instead of 43)
+    'float32': {
+        'temp': np.float32, 'pollution': np.float32, 'wind_speed': np.float32,
+        'gen_pollution': np.float32, 'absorb_pollution': np.float32,
+        'element': np.uint8, 'wind_direction': np.uint8, 'clouds': np.uint8
+    },
+}
+
+# Rows computed at once by step_state; the temporaries of a step scale with a band, not the map
+STEP_BAND_ROWS = 256
+# Working set of step_rows per cell of a band (tracemalloc peak, rounded up): masks, codes and
+# float64 lookups, plus float temporaries in the precision of the state
+STEP_BYTES_PER_CELL = 36
+STEP_FLOAT_TEMPORARIES = 22
+
+# Initial value of each attribute, indexed by element code
+INITIAL_VALUES = {
+    field: np.array([Cell.ELEMENT_ATTRIBUTES[element][field] for element in ELEMENTS], dtype=np.float64)
+    for field in FLOAT_FIELDS
+}
+INITIAL_VALUES['wind_direction'] = np.array(
+    [WIND_DIRECTIONS.index(Cell.ELEMENT_ATTRIBUTES[element]['wind_direction']) for element in ELEMENTS], dtype=np.uint8
+)
+INITIAL_VALUES['clouds'] = np.array(
+    [CLOUD_STATES.index(Cell.ELEMENT_ATTRIBUTES[element]['clouds']) for element in ELEMENTS], dtype=np.uint8
+)
+
+def resolve_dtypes(precision='float64', dtypes=None):
+    """
+    Build the dtype of every field from a precision mode, optionally overriding some fields.
+
+    Args:
+    precision (str): One of the keys of PRECISION_MODES.
+    dtypes (dict): Optional {field: dtype} overrides (e.g., {'temp': np.float64}).
+
+    Returns:
+    - dict: {field: np.dtype} for every field in FIELDS.
+    """
+    if precision not in PRECISION_MODES:
+        raise ValueError(f"Unknown precision mode '{precision}', expected one of {sorted(PRECISION_MODES)}.")
+    resolved = {field: np.dtype(dtype) for field, dtype in PRECISION_MODES[precision].items()}
+    for field, dtype in (dtypes or {}).items():
+        if field not in resolved:
+            raise ValueError(f"Unknown state field '{field}'.")
+        dtype = np.dtype(dtype)
+        if field in CODE_FIELDS and dtype.kind not in 'ui':
+            raise ValueError(f"Field '{field}' stores codes and needs an integer dtype.")
+        resolved[field] = dtype
+    return resolved
+
+def estimate_memory(map_size, precision='float64', dtypes=None, generations=2, band_rows=STEP_BAND_ROWS):
+    """
+    Estimate the bytes needed to step a map_size x map_size state, before allocating it.
+
+    `generations` is the number of states kept at once; stepping keeps the current
+    and the next generation, so the default is 2. step_state computes the next generation
+    in bands of `band_rows` rows, and the temporaries of one band (with its halo rows) are
+    added on top; pass band_rows=None to count the stored states only.
+    """
+    resolved = resolve_dtypes(precision, dtypes)
+    bytes_per_cell = sum(dtype.itemsize for dtype in resolved.values())
+    num_bytes = bytes_per_cell * map_size * map_size * generations
+    if band_rows:
+        band_cells = (min(band_rows, map_size) + 2) * map_size
+        num_bytes += band_cells * (STEP_BYTES_PER_CELL + STEP_FLOAT_TEMPORARIES * resolved['temp'].itemsize)
+    return num_bytes
+
+def format_bytes(num_bytes):
+    """Format a number of bytes as a human readable string (e.g., '9.20 GB')."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1000:
+            return f"{num_bytes:.2f} {unit}"
+        num_bytes /= 1000
+    return f"{num_bytes:.2f} TB"
+
+def element_layout_rows(size, start, stop):
+    """
+    Compute the element codes of rows [start, stop) of the initial map.
+    Uses the same regions as MapGenerator.create_cell, without creating Cell objects.
+    """
+    sea_border = size // 7
+    glacier_width = size // 6
+    land_start = size // 5
+    land_end = land_start + size // 4
+
+    i = np.arange(start, stop)[:, None]
+    j = np.arange(size)[None, :]
+
+    glacier = ((i < glacier_width) | (i >= size - glacier_width)) & ((j < glacier_width) | (j >= size - glacier_width))
+    sea = (i < sea_border) | (j < sea_border) | (i >= size - sea_border) | (j >= size - sea_border)
+    land = (land_start <= i) & (i < land_end) & (land_start <= j) & (j < land_end)
+    forest = ((land_start - sea_border <= i) & (i < land_start)) | ((land_end <= i) & (i < land_end + sea_border)) | \
+             ((land_start - sea_border <= j) & (j < land_start)) | ((land_end <= j) & (j < land_end + sea_border))
+
+    # Same priority as the if/elif chain in MapGenerator.create_cell
+    return np.select(
+        [glacier, sea, land, forest],
+        [ELEMENTS.index('glacier'), ELEMENTS.index('sea'), ELEMENTS.index('land'), ELEMENTS.index('forest')],
+        default=ELEMENTS.index('city')
+    ).astype(np.uint8)
+
+
+class GridState:
+    """
+    The state of the whole map stored as one 2D array per attribute.
+    Arrays are available as attributes named after FIELDS (e.g., state.temp, state.element).
+    """
+
+    def __init__(self, size, precision='float64', dtypes=None, allocate=True):
+        """
+        Initializes an empty (all zeros) state.
+
+        Args:
+        size (int): The width and height of the map.
+        precision (str): One of the keys of PRECISION_MODES.
+        dtypes (dict): Optional {field: dtype} overrides.
+        allocate (bool): If False the arrays are not allocated and must be assigned by the caller.
+        """
+        self.size = size
+        self.dtypes = resolve_dtypes(precision, dtypes)
+        if allocate:
+            for field, dtype in self.dtypes.items():
+                setattr(self, field, np.zeros((size, size), dtype=dtype))
+
+    @classmethod
+    def create(cls, size, precision='float64', dtypes=None):
+        """Create the initial state of a size x size map (same layout as MapGenerator)."""
+        if size < 10:
+            raise ValueError("Map size must be 10 or greater.")
+        state = cls(size, precision, dtypes)
+        state.fill_initial_rows(0, size)
+        return state
+
+    @classmethod
+    def from_map(cls, map, precision='float64', dtypes=None):
+        """Create a state from a 2D list of Cell objects."""
+        state = cls(len(map), precision, dtypes)
+        for i, row in enumerate(map):
+            for j, cell in enumerate(row):
+                state.element[i, j] = ELEMENTS.index(cell.element)
+                state.temp[i, j] = cell.get_temp()
+                state.pollution[i, j] = cell.get_pollution()
+                state.wind_speed[i, j] = cell.get_wind_speed()
+                state.gen_pollution[i, j] = cell.get_gen_pollution()
+                state.absorb_pollution[i, j] = cell.get_absorb_pollution()
+                state.wind_direction[i, j] = WIND_DIRECTIONS.index(cell.get_wind_direction())
+                state.clouds[i, j] = CLOUD_STATES.index(cell.get_cloud() or '')
+        return state
+
+    def fill_initial_rows(self, start, stop):
+        """Fill rows [start, stop) with the initial elements and their attributes."""
+        element = element_layout_rows(self.size, start, stop)
+        self.element[start:stop] = element
+        for field in FIELDS:
+            if field != 'element':
+                getattr(self, field)[start:stop] = INITIAL_VALUES[field][element]
+
+    def to_map(self):
+        """Convert the state back to a 2D list of Cell objects."""
+        map = [[None for _ in range(self.size)] for _ in range(self.size)]
+        for i in range(self.size):
+            for j in range(self.size):
+                cell = Cell(i, j, ELEMENTS[self.element[i, j]])
+                cell.set_temp(float(self.temp[i, j]))
+                cell.set_pollution(float(self.pollution[i, j]))
+                cell.set_wind_speed(float(self.wind_speed[i, j]))
+                cell.set_gen_pollution(float(self.gen_pollution[i, j]))
+                cell.set_absorb_pollution(float(self.absorb_pollution[i, j]))
+                cell.set_wind_direction(WIND_DIRECTIONS[self.wind_direction[i, j]])
+                cell.set_cloud(CLOUD_STATES[self.clouds[i, j]])
+                map[i][j] = cell
+        return map
+
+    def copy(self, precision=None, dtypes=None):
+        """Return a copy of the state, optionally converted to another precision mode."""
+        new_dtypes = self.dtypes if precision is None else resolve_dtypes(precision, dtypes)
+        state = GridState(self.size, allocate=False)
+        state.dtypes = dict(new_dtypes)
+        for field in FIELDS:
+            setattr(state, field, getattr(self, field).astype(new_dtypes[field]))
+        return state
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the state arrays."""
+        return sum(getattr(self, field).nbytes for field in FIELDS)
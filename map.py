@@ -1,4 +1,4 @@
-import cell 
+import Cell
 
 class MapGenerator:
     def __init__(self, size):
@@ -51,7 +51,7 @@ class MapGenerator:
             element = 'city'
         
         # Create a Cell object with the determined element type
-        return cell.Cell(i, j, element)
+        return Cell.Cell(i, j, element)
 
     def get_neighbors(self, i, j):
         """
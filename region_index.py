@@ -0,0 +1,363 @@
+"""
+Per-region statistics of a GridState.
+Answers mean / standard deviation queries for element types, rectangles, registered masks and
+connected regions (cells of one element joined through north, south, east and west neighbours,
+e.g. each glacier body). Region labels are maintained incrementally as elements change, and the
+sums behind the queries are computed on first use after each step (one vectorised pass per kind
+of query), so every further query of that step is O(1).
+"""
+import numpy as np
+from grid_state import ELEMENTS
+
+STAT_FIELDS = ('temp', 'pollution')
+
+def row_runs(codes):
+    """
+    Split every row of a 2D array of codes into runs of equal codes, skipping code -1.
+
+    Returns:
+    - (rows, starts, stops, run_codes): the row, first column, end column and code of every
+      run, in row-major order.
+    """
+    num_cols = codes.shape[1]
+    boundaries = np.ones(codes.shape, dtype=bool)
+    boundaries[:, 1:] = codes[:, 1:] != codes[:, :-1]
+    positions = np.flatnonzero(boundaries)
+    rows, starts = np.divmod(positions, num_cols)
+    # Every row starts a run, so a run ends where the next one starts (or at the end of its row)
+    stops = np.append(positions[1:], codes.size) - rows * num_cols
+    run_codes = codes.ravel()[positions]
+    keep = run_codes != -1
+    return rows[keep], starts[keep], stops[keep], run_codes[keep]
+
+def cell_runs(element, cells):
+    """
+    Split sorted flat cell indices into runs of consecutive cells of one row with equal elements.
+
+    Returns:
+    - (rows, starts, stops, run_codes): the row, first column, end column and element code of
+      every run, in row-major order.
+    """
+    num_cols = element.shape[1]
+    codes = element.ravel()[cells]
+    breaks = np.ones(len(cells), dtype=bool)
+    breaks[1:] = (np.diff(cells) != 1) | (codes[1:] != codes[:-1]) | (cells[1:] % num_cols == 0)
+    first = np.flatnonzero(breaks)
+    rows, starts = np.divmod(cells[first], num_cols)
+    return rows, starts, starts + np.diff(np.append(first, len(cells))), codes[first]
+
+def merge_runs(rows, starts, stops, run_codes):
+    """
+    Merge row runs that touch a run of the row above with the same code (union-find), so the
+    work depends on the number of runs.
+
+    Returns:
+    - (run_labels, count): the region label (0 to count - 1, in order of appearance) of every run
+      and the number of regions.
+    """
+    row_values, row_first = np.unique(rows, return_index=True)
+    offsets = row_first.tolist() + [len(rows)]
+    row_values = row_values.tolist()
+    starts, stops, run_codes = starts.tolist(), stops.tolist(), run_codes.tolist()
+    parent = list(range(len(starts)))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    for k in range(1, len(row_values)):
+        if row_values[k] != row_values[k - 1] + 1:
+            continue
+        a, a_stop = offsets[k - 1], offsets[k]
+        b, b_stop = offsets[k], offsets[k + 1]
+        while a < a_stop and b < b_stop:
+            if run_codes[a] == run_codes[b] and starts[a] < stops[b] and starts[b] < stops[a]:
+                root_a, root_b = find(a), find(b)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+            if stops[a] <= stops[b]:
+                a += 1
+            else:
+                b += 1
+
+    # A root is the first run of its region in row-major order, so sorted roots number the
+    # regions in order of appearance
+    roots = np.array([find(run) for run in range(len(parent))], dtype=np.int64)
+    unique_roots, run_labels = np.unique(roots, return_inverse=True)
+    return run_labels, len(unique_roots)
+
+def label_components(element, mask=None):
+    """
+    Label the connected regions of equal elements (north, south, east and west neighbours).
+
+    Args:
+    element (np.ndarray): 2D array of element codes.
+    mask (np.ndarray): Optional boolean mask; cells outside it are not labeled.
+
+    Returns:
+    - (labels, count): int32 labels from 0 to count - 1 (-1 outside the mask) and the number of regions.
+    """
+    codes = element.astype(np.int16)
+    if mask is not None:
+        codes[~mask] = -1
+    rows, starts, stops, run_codes = row_runs(codes)
+    run_labels, count = merge_runs(rows, starts, stops, run_codes)
+    lengths = stops - starts
+    first_cells = rows * codes.shape[1] + starts
+    cells = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - first_cells, lengths)
+    labels = np.full(element.shape, -1, dtype=np.int32)
+    labels.ravel()[cells] = np.repeat(run_labels, lengths)
+    return labels, count
+
+def label_cells(element, cells):
+    """
+    Label the connected regions of equal elements formed by a set of cells; the work depends
+    on the number of cells given, not on the size of the map.
+
+    Args:
+    element (np.ndarray): 2D array of element codes.
+    cells (np.ndarray): Sorted flat indices of the cells to label.
+
+    Returns:
+    - (cell_labels, count): the label (0 to count - 1) of every given cell and the number of regions.
+    """
+    rows, starts, stops, run_codes = cell_runs(element, cells)
+    run_labels, count = merge_runs(rows, starts, stops, run_codes)
+    return np.repeat(run_labels, stops - starts), count
+
+def summed_area_table(values):
+    """Summed-area table with a leading row and column of zeros (sat[i, j] = sum of values[:i, :j])."""
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    return table
+
+def mean_and_std(count, total, total_squares=None):
+    """
+    Mean and (population) standard deviation from a count, a sum and a sum of squares.
+    The standard deviation is None without a sum of squares.
+    """
+    if count == 0:
+        return None, None
+    mean = float(total) / count
+    if total_squares is None:
+        return mean, None
+    return mean, max(float(total_squares) / count - mean ** 2, 0) ** 0.5
+
+
+class RegionIndex:
+    """
+    Index of the regions of a GridState.
+
+    Call update() once per step with the new generation. It relabels only the regions that lost
+    cells (their largest part keeps the label, so a melting glacier body keeps its label) and
+    attaches the changed cells to the neighbouring regions of their new element. The sums behind the queries are computed
+    when first needed and kept until the next update: per-region sums take one bincount over the
+    cells and per-element sums are added up from them, sums of squares are only computed for
+    standard deviations, and summed-area tables only for rectangle queries.
+    """
+
+    def __init__(self, state):
+        self.element = state.element.copy()
+        self.labels, self.label_count = label_components(self.element)
+        self.region_elements = np.zeros(self.label_count, dtype=self.element.dtype)
+        self.region_elements[self.labels.ravel()] = self.element.ravel()
+        self.region_counts = np.bincount(self.labels.ravel(), minlength=self.label_count)
+        self.masks = {}  # Name -> flat indices of a registered mask
+        self.refresh(state)
+
+    def register_mask(self, name, mask):
+        """Register a boolean mask to query with mask_stats()."""
+        self.masks[name] = np.flatnonzero(mask)
+
+    def update(self, state):
+        """Update the labels to a new generation and drop the sums of the previous one."""
+        changed = np.flatnonzero(self.element != state.element)
+        if len(changed):
+            self.relabel(changed, state.element)
+        self.refresh(state)
+
+    def new_label(self, code, count=0):
+        """Add a region label for an element code with `count` cells."""
+        self.region_elements = np.append(self.region_elements, np.array([code], dtype=self.region_elements.dtype))
+        self.region_counts = np.append(self.region_counts, count)
+        self.label_count += 1
+        return self.label_count - 1
+
+    def relabel(self, changed, element):
+        """
+        Relabel the regions around the cells whose element changed (sorted flat indices).
+        A region can only split where it lost cells, so only the regions that lost cells are
+        labeled again; the changed cells then join (and may merge) the neighbouring regions of
+        their new element, so a region that only grows, like the sea around a melting glacier,
+        is never relabeled.
+        """
+        flat_labels = self.labels.ravel()
+        flat_element = element.ravel()
+        old_labels = flat_labels[changed]
+        lost = np.unique(old_labels)
+        flat_labels[changed] = -1
+        self.region_counts -= np.bincount(old_labels, minlength=self.label_count)
+
+        # Regions that lost cells may have split: their largest part keeps the label
+        is_lost = np.zeros(self.label_count + 1, dtype=bool)  # The last entry is looked up by -1
+        is_lost[lost] = True
+        remaining = np.flatnonzero(is_lost[flat_labels])
+        part_labels, part_count = label_cells(element, remaining)
+        if part_count > np.count_nonzero(self.region_counts[lost]):
+            old_ids = np.zeros(part_count, dtype=np.int64)
+            old_ids[part_labels] = flat_labels[remaining]
+            sizes = np.bincount(part_labels, minlength=part_count)
+            new_ids = old_ids.copy()
+            kept = set()
+            for part in np.argsort(-sizes, kind='stable').tolist():
+                old = int(old_ids[part])
+                if old in kept:
+                    new_ids[part] = self.new_label(self.region_elements[old], sizes[part])
+                    self.region_counts[old] -= sizes[part]
+                kept.add(old)
+            flat_labels[remaining] = new_ids[part_labels]
+
+        # Changed cells join the neighbouring regions of their new element
+        cell_labels, cell_count = label_cells(element, changed)
+        parent = {}
+
+        def find(node):
+            while parent.get(node, node) != node:
+                node = parent[node]
+            return node
+
+        def size(node):
+            # New groups of changed cells lose to any existing region
+            return -1 if isinstance(node, tuple) else self.region_counts[node]
+
+        num_rows, num_cols = element.shape
+        rows, cols = np.divmod(changed, num_cols)
+        for row_offset, col_offset in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            n_rows, n_cols = rows + row_offset, cols + col_offset
+            inside = (n_rows >= 0) & (n_rows < num_rows) & (n_cols >= 0) & (n_cols < num_cols)
+            neighbors = n_rows[inside] * num_cols + n_cols[inside]
+            neighbor_labels = flat_labels[neighbors]
+            joins = (neighbor_labels >= 0) & (flat_element[neighbors] == flat_element[changed[inside]])
+            pairs = np.unique(np.stack([cell_labels[inside][joins], neighbor_labels[joins]]), axis=1)
+            for group, label in pairs.T.tolist():
+                root_a, root_b = find(('new', group)), find(label)
+                if root_a != root_b:
+                    # The larger region keeps its label
+                    if size(root_a) > size(root_b):
+                        root_a, root_b = root_b, root_a
+                    parent[root_a] = root_b
+
+        group_elements = np.zeros(cell_count, dtype=element.dtype)
+        group_elements[cell_labels] = flat_element[changed]
+        group_ids = np.empty(cell_count, dtype=np.int64)
+        for group in range(cell_count):
+            root = find(('new', group))
+            if isinstance(root, tuple):
+                root = parent[root] = self.new_label(group_elements[root[1]])
+            group_ids[group] = root
+        flat_labels[changed] = group_ids[cell_labels]
+        self.region_counts += np.bincount(group_ids[cell_labels], minlength=self.label_count)
+
+        merged = [label for label in parent if not isinstance(label, tuple) and find(label) != label]
+        if merged:
+            remap = np.arange(self.label_count, dtype=self.labels.dtype)
+            for label in merged:
+                remap[label] = find(label)
+                self.region_counts[remap[label]] += self.region_counts[label]
+                self.region_counts[label] = 0
+            self.labels = remap[self.labels]
+        self.element = element.copy()
+
+    def refresh(self, state):
+        """Point the index at a generation; its sums are computed by the first query that needs them."""
+        self.state_values = {field: getattr(state, field) for field in STAT_FIELDS}
+        self.sums = {}
+        self.element_counts = np.bincount(
+            self.region_elements, weights=self.region_counts, minlength=len(ELEMENTS)
+        ).astype(np.int64)
+
+    def cached(self, key, compute):
+        """The sums stored under `key` for the current generation, computed on first use."""
+        if key not in self.sums:
+            self.sums[key] = compute()
+        return self.sums[key]
+
+    def values(self, field, squares=False):
+        """The flat float64 values of `field` (or their squares)."""
+        if squares:
+            return self.cached(('squares', field), lambda: self.values(field) ** 2)
+        return self.cached(('values', field), lambda: self.state_values[field].astype(np.float64).ravel())
+
+    def region_sums(self, field, squares=False):
+        """The sum of `field` (or of its squares) over every region, indexed by label."""
+        return self.cached(('regions', field, squares), lambda: np.bincount(
+            self.labels.ravel(), self.values(field, squares), self.label_count
+        ))
+
+    def element_sums(self, field, squares=False):
+        """The sum of `field` (or of its squares) over every element, added up from the region sums."""
+        return self.cached(('elements', field, squares), lambda: np.bincount(
+            self.region_elements, self.region_sums(field, squares), len(ELEMENTS)
+        ))
+
+    def table(self, field, squares=False):
+        """The summed-area table of `field` (or of its squares)."""
+        return self.cached(('table', field, squares), lambda: summed_area_table(
+            self.values(field, squares).reshape(self.labels.shape)
+        ))
+
+    def mask_sum(self, name, field, squares=False):
+        """The sum of `field` (or of its squares) over a registered mask."""
+        return self.cached(('mask', name, field, squares), lambda: float(np.sum(
+            self.values(field, squares)[self.masks[name]]
+        )))
+
+    def regions(self, element=None):
+        """Labels of the current regions, optionally only those of one element (e.g., 'glacier')."""
+        present = np.flatnonzero(self.region_counts)
+        if element is None:
+            return present.tolist()
+        code = ELEMENTS.index(element)
+        return present[self.region_elements[present] == code].tolist()
+
+    def region_element(self, label):
+        """The element of a connected region (e.g., 'glacier')."""
+        return ELEMENTS[self.region_elements[label]]
+
+    def label_at(self, row, col):
+        """The label of the region containing cell (row, col)."""
+        return int(self.labels[row, col])
+
+    def region_stats(self, label, field='temp', std=True):
+        """(mean, std) of `field` over a connected region (std is None when not requested)."""
+        squares = self.region_sums(field, True)[label] if std else None
+        return mean_and_std(self.region_counts[label], self.region_sums(field)[label], squares)
+
+    def region_size(self, label):
+        """The number of cells of a connected region."""
+        return int(self.region_counts[label])
+
+    def element_stats(self, element, field='temp', std=True):
+        """(mean, std) of `field` over all cells of an element (e.g., 'city'; std is None when not requested)."""
+        code = ELEMENTS.index(element)
+        squares = self.element_sums(field, True)[code] if std else None
+        return mean_and_std(self.element_counts[code], self.element_sums(field)[code], squares)
+
+    def rectangle_stats(self, row_start, row_stop, col_start, col_stop, field='temp', std=True):
+        """
+        (mean, std) of `field` over rows [row_start, row_stop) and columns [col_start, col_stop)
+        (std is None when not requested).
+        """
+        def rectangle_sum(table):
+            return (table[row_stop, col_stop] - table[row_start, col_stop] -
+                    table[row_stop, col_start] + table[row_start, col_start])
+        count = max(row_stop - row_start, 0) * max(col_stop - col_start, 0)
+        squares = rectangle_sum(self.table(field, True)) if std else None
+        return mean_and_std(count, rectangle_sum(self.table(field)), squares)
+
+    def mask_stats(self, name, field='temp', std=True):
+        """(mean, std) of `field` over a registered mask (std is None when not requested)."""
+        squares = self.mask_sum(name, field, True) if std else None
+        return mean_and_std(len(self.masks[name]), self.mask_sum(name, field), squares)
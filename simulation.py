@@ -1,25 +1,14 @@
-import tkinter as tk
 import time
-import random
 from map import MapGenerator
-from cell import Cell
-from calculations import (
-    calc_temp,
-    calc_pollution,
-    calc_wind_speed,
-    calc_wind_direction,
-    calc_cloud_state
-
-)
-from visualization import read_averages, plot_combined_with_separate_std_and_normalized
-from calculation_utils import increase_get_pollution
 from simulation_utils import (
     calculate_map_averages,
-    check_and_update_cell_type,
     delete_files,
-    add_clouds_to_glaciers,
+    run_fast_forward,
 )
 
+# tkinter, matplotlib and numpy are imported where they are used, so batch workers that
+# import this module (or only step the map) do not pay for GUI and plotting start-up.
+
 # Constants
 CELL_COLORS = {
     'city': 'grey',
@@ -35,15 +24,24 @@ CLOUD_ICONS = {
 }
 
 class SimulationApp:
-    def __init__(self, root, map_size, iterations):
+    def __init__(self, root, map_size, iterations, stride=1, policy=None, detector=None):
         """
         Initialize the simulation app with UI components and simulation setup.
+        With `stride` k, only every k-th generation is drawn and recorded; with an AdaptiveStride
+        `policy` the stride starts at policy.stride and follows the rate of change of the global
+        averages.
+        A ConvergenceDetector stops the run early once the map has settled.
         """
+        import tkinter as tk
+
         self.root = root
         self.root.title("Environmental Simulation")
 
         self.map_size = map_size
         self.iterations = iterations
+        self.stride = stride
+        self.policy = policy
+        self.detector = detector
         self.map_generator = MapGenerator(map_size)
         self.map = self.map_generator.map
 
@@ -109,50 +107,33 @@ class SimulationApp:
                     text=cloud_icon, font=("Arial", max(8, self.cell_size // 3)), fill="blue"
                 )
 
-    def update_simulation(self):
-        """
-        Perform a simulation step by updating temperature, pollution, clouds, and wind for all cells.
-        """
-        next_map = [[None for _ in range(self.map_size)] for _ in range(self.map_size)]
-
-        for i in range(self.map_size):
-            for j in range(self.map_size):
-                cell = self.map[i][j]
-                next_cell = Cell(cell.x, cell.y, cell.element)
-                next_cell.set_temp(calc_temp(self.map, self.map_generator, cell))
-                next_cell.set_pollution(calc_pollution(self.map, self.map_generator, cell))
-                next_cell.set_cloud(calc_cloud_state(self.map_generator, cell, random.randint(0, 3), random.randint(0, 3)))
-                next_cell.set_wind_speed(calc_wind_speed(self.map_generator, cell))
-                next_cell.set_wind_direction(calc_wind_direction(self.map_generator, cell))
-                check_and_update_cell_type(next_cell)
-                increase_get_pollution(next_cell)
-
-                next_map[i][j] = next_cell
-
-        self.map = next_map
-
     def start_simulation(self):
         """
         Start the simulation loop for the defined number of iterations.
         """
+        import tkinter as tk
+
         self.start_button.config(state=tk.DISABLED)
 
-        for iteration in range(1, self.iterations + 1):
-            add_clouds_to_glaciers(self.map, self.map_size, iteration)
-            self.update_simulation()
+        observations = run_fast_forward(self.map, self.map_generator, self.map_size, self.iterations, self.stride, self.policy, self.detector)
+        for iteration, self.map, summary in observations:
             self.update_grid()
-            # update_clouds(self.map, self.map_generator, self.map_size, iteration, cloud_lifecycles)
             calculate_map_averages(
                 self.map, self.map_size,
                 self.avg_temp_label, self.avg_pollution_label,
-                self.std_temp_label, self.std_pollution_label
+                self.std_temp_label, self.std_pollution_label, iteration, summary
             )
 
             self.root.update()
             time.sleep(0.0001)
-        root.destroy()
+        if self.detector and self.detector.reason:
+            print(f"Simulation stopped early: {self.detector.reason}")
+        self.root.destroy()
 
 if __name__ == "__main__":
+    import tkinter as tk
+    from visualization import read_observations, plot_combined_with_separate_std_and_normalized
+
     root = tk.Tk()
     app = SimulationApp(root, map_size=20, iterations=365)
     root.mainloop()
@@ -162,12 +143,12 @@ if __name__ == "__main__":
     pollution_file = "average_pollution.txt"
 
     # Read data from files
-    temperature_averages = read_averages(temp_file)
-    pollution_averages = read_averages(pollution_file)
+    days, temperature_averages = read_observations(temp_file)
+    _, pollution_averages = read_observations(pollution_file)
 
     # Check if both data sets have values
     if temperature_averages and pollution_averages:
-        plot_combined_with_separate_std_and_normalized(temperature_averages, pollution_averages)
+        plot_combined_with_separate_std_and_normalized(temperature_averages, pollution_averages, days)
     else:
         print("Ensure both files contain data.")
 
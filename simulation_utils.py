@@ -1,10 +1,134 @@
 import os
-import numpy as np
+import random
+from statistics import pstdev
+from Cell import Cell
+from calculations import (
+    calc_temp,
+    calc_pollution,
+    calc_wind_speed,
+    calc_wind_direction,
+    calc_cloud_state
+)
+from calculation_utils import increase_get_pollution
+from convergence import map_summary
 
-def calculate_map_averages(map, map_size, avg_temp_label, avg_pollution_label, std_temp_label, std_pollution_label):
+def next_generation(map, map_generator, map_size):
     """
-    Calculate and display the average temperature and pollution, along with their standard deviations.
-    Append the averages to corresponding files.
+    Build the next generation of the map by updating temperature, pollution, clouds and wind for all cells.
+    Has no GUI or plotting dependencies, so headless runs can step the map directly.
+    """
+    next_map = [[None for _ in range(map_size)] for _ in range(map_size)]
+
+    for i in range(map_size):
+        for j in range(map_size):
+            cell = map[i][j]
+            next_cell = Cell(cell.x, cell.y, cell.element)
+            next_cell.set_temp(calc_temp(map, map_generator, cell))
+            next_cell.set_pollution(calc_pollution(map, map_generator, cell))
+            next_cell.set_cloud(calc_cloud_state(map_generator, cell, random.randint(0, 3), random.randint(0, 3)))
+            next_cell.set_wind_speed(calc_wind_speed(map_generator, cell))
+            next_cell.set_wind_direction(calc_wind_direction(map_generator, cell))
+            check_and_update_cell_type(next_cell)
+            increase_get_pollution(next_cell)
+
+            next_map[i][j] = next_cell
+
+    return next_map
+
+class AdaptiveStride:
+    """
+    Chooses how many generations to run back-to-back between two observations.
+    The global averages drift at a slowly changing rate, so the stride is set relative to that
+    rate rather than to absolute thresholds: it doubles while the per-step change of both
+    averages stays within `tolerance` of its rate at the previous observation, and halves when
+    either change accelerates beyond that.
+    """
+
+    def __init__(self, stride=1, min_stride=1, max_stride=64, tolerance=0.25):
+        """
+        Args:
+        stride (int): The initial number of generations per observation.
+        min_stride, max_stride (int): Bounds of the stride.
+        tolerance (float): Relative increase of a per-step change, from one observation to the
+            next, that still counts as steady (0.25 allows the rate to grow by 25%).
+        """
+        if not 1 <= min_stride <= stride <= max_stride:
+            raise ValueError("Stride bounds must satisfy 1 <= min_stride <= stride <= max_stride.")
+        if tolerance <= 0:
+            raise ValueError("Tolerance must be greater than 0.")
+        self.stride = stride
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.tolerance = tolerance
+        self.last_rates = None
+
+    def update(self, previous_averages, averages, steps):
+        """
+        Update the stride from the global (temperature, pollution) averages before and after
+        `steps` generations, and return the new stride.
+        """
+        rates = [abs(new - old) / steps for old, new in zip(previous_averages, averages)]
+        if self.last_rates is not None:
+            # The largest growth of a per-step change since the previous observation
+            acceleration = max(
+                rate / last_rate if last_rate else (1 if rate == 0 else float('inf'))
+                for rate, last_rate in zip(rates, self.last_rates)
+            )
+            if acceleration <= 1 + self.tolerance:
+                self.stride = min(self.stride * 2, self.max_stride)
+            else:
+                self.stride = max(self.stride // 2, self.min_stride)
+        self.last_rates = rates
+        return self.stride
+
+def fast_forward(map, map_generator, map_size, steps):
+    """Run `steps` generations back-to-back, without rendering, statistics or file I/O."""
+    for _ in range(steps):
+        map = next_generation(map, map_generator, map_size)
+    return map
+
+def run_fast_forward(map, map_generator, map_size, iterations, stride=1, policy=None, detector=None):
+    """
+    Run the simulation for `iterations` generations and yield only every k-th generation.
+    Every observed generation is summarized once (see convergence.map_summary), and that one
+    pass serves the caller's statistics, the policy and the detector.
+
+    Args:
+    stride (int): The number of generations between observations (k).
+    policy (AdaptiveStride): Optional policy that changes k after every observation.
+    detector (ConvergenceDetector): Optional detector updated after every observation; the
+        run stops early once it reports convergence (the reason is kept in detector.reason).
+
+    Yields:
+    - (iteration, map, summary): The iteration number, the map and the map_summary of every
+      observed generation (the last generation is always observed).
+    """
+    if stride < 1:
+        raise ValueError("Stride must be 1 or greater.")
+    stride = policy.stride if policy else stride
+    add_clouds_to_glaciers(map, map_size, 1)
+    summary = map_summary(map) if policy else None
+    iteration = 0
+    while iteration < iterations:
+        steps = min(stride, iterations - iteration)
+        map = fast_forward(map, map_generator, map_size, steps)
+        iteration += steps
+        previous_summary, summary = summary, map_summary(map)
+        yield iteration, map, summary
+
+        if detector and detector.update(summary, steps):
+            return
+        if policy:
+            stride = policy.update(
+                (previous_summary['avg_temp'], previous_summary['avg_pollution']),
+                (summary['avg_temp'], summary['avg_pollution']),
+                steps
+            )
+
+def compute_map_averages(map, map_size):
+    """
+    Calculate the average temperature and pollution of the map, along with their standard deviations.
+    Returns (avg_temp, avg_pollution, std_temp, std_pollution).
     """
     total_temp = 0
     total_pollution = 0
@@ -25,8 +149,24 @@ def calculate_map_averages(map, map_size, avg_temp_label, avg_pollution_label, s
     num_cells = map_size ** 2
     avg_temp = total_temp / num_cells
     avg_pollution = total_pollution / num_cells
-    std_temp = np.std(temp_values)
-    std_pollution = np.std(pollution_values)
+    std_temp = pstdev(temp_values)
+    std_pollution = pstdev(pollution_values)
+
+    return avg_temp, avg_pollution, std_temp, std_pollution
+
+def calculate_map_averages(map, map_size, avg_temp_label, avg_pollution_label, std_temp_label, std_pollution_label,
+                           iteration, summary=None):
+    """
+    Calculate and display the average temperature and pollution, along with their standard deviations.
+    Append the averages to corresponding files, each after the iteration it was observed at
+    (with a stride, not every iteration is observed).
+    A map_summary of the map (as yielded by run_fast_forward) is used instead of another pass over the map.
+    """
+    if summary is None:
+        avg_temp, avg_pollution, std_temp, std_pollution = compute_map_averages(map, map_size)
+    else:
+        avg_temp, avg_pollution = summary['avg_temp'], summary['avg_pollution']
+        std_temp, std_pollution = summary['std_temp'], summary['std_pollution']
 
     # Update UI labels
     avg_temp_label.config(text=f"Average Temperature: {avg_temp:.2f}")
@@ -37,12 +177,12 @@ def calculate_map_averages(map, map_size, avg_temp_label, avg_pollution_label, s
     # Append average temperature to file
     temp_file_path = "average_temperature.txt"
     with open(temp_file_path, "a") as temp_file:
-        temp_file.write(f"{avg_temp:.2f}\n")
+        temp_file.write(f"{iteration} {avg_temp:.2f}\n")
 
     # Append average pollution to file
     pollution_file_path = "average_pollution.txt"
     with open(pollution_file_path, "a") as pollution_file:
-        pollution_file.write(f"{avg_pollution:.3f}\n")
+        pollution_file.write(f"{iteration} {avg_pollution:.3f}\n")
 
 def check_and_update_cell_type(cell):
     """
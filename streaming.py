@@ -0,0 +1,90 @@
+"""
+Out-of-core stepping for maps larger than memory.
+The current and next generations are kept in memory-mapped .npy files, and each step
+processes the map in bands of rows, so peak memory depends on the band size only.
+"""
+import os
+import numpy as np
+from grid_state import GridState, FIELDS
+from grid_calculations import step_rows, global_averages, GLACIER, CLEAR, CLOUD
+
+class StreamingSimulation:
+    """
+    A simulation whose state lives on disk.
+
+    Every step runs two passes over the current generation:
+    1. A streaming reduction of the global average temperature and pollution.
+    2. For every band of rows, read the band plus one row above and below it and write
+       the band of the next generation.
+    The two generations then swap files.
+    """
+
+    def __init__(self, directory, size, band_rows=256, precision='float32', dtypes=None, seed=None):
+        """
+        Creates the state files in `directory` and fills them with the initial map.
+
+        Args:
+        directory (str): Where the memory-mapped state files are created.
+        size (int): The width and height of the map.
+        band_rows (int): The number of rows processed at once.
+        precision (str): One of the keys of grid_state.PRECISION_MODES.
+        dtypes (dict): Optional {field: dtype} overrides.
+        seed (int): Seed for the random cloud and rain thresholds.
+        """
+        if size < 10:
+            raise ValueError("Map size must be 10 or greater.")
+        if band_rows < 1:
+            raise ValueError("Band must have at least one row.")
+
+        self.directory = directory
+        self.size = size
+        self.band_rows = band_rows
+        self.rng = np.random.default_rng(seed)
+        self.iteration = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.state = self.open_state('generation_a', precision, dtypes)
+        self.next_state = self.open_state('generation_b', precision, dtypes)
+        for start, stop in self.bands():
+            self.state.fill_initial_rows(start, stop)
+            clouds = self.state.clouds[start:stop]
+            clouds[(self.state.element[start:stop] == GLACIER) & (clouds == CLEAR)] = CLOUD
+        self.flush()
+
+    def open_state(self, name, precision, dtypes):
+        """Create a GridState whose arrays are memory-mapped files named '<name>_<field>.npy'."""
+        state = GridState(self.size, precision, dtypes, allocate=False)
+        for field in FIELDS:
+            path = os.path.join(self.directory, f"{name}_{field}.npy")
+            setattr(state, field, np.lib.format.open_memmap(
+                path, mode='w+', dtype=state.dtypes[field], shape=(self.size, self.size)
+            ))
+        return state
+
+    def bands(self):
+        """Yield the (start, stop) rows of every band."""
+        for start in range(0, self.size, self.band_rows):
+            yield start, min(start + self.band_rows, self.size)
+
+    def global_averages(self):
+        """The global average temperature and pollution of the current generation."""
+        return global_averages(self.state, self.band_rows)
+
+    def step(self):
+        """Compute the next generation band by band and make it the current one."""
+        global_temp, global_pollution = self.global_averages()
+        for start, stop in self.bands():
+            step_rows(self.state, self.next_state, start, stop, global_temp, global_pollution, self.rng)
+        self.state, self.next_state = self.next_state, self.state
+        self.flush()
+        self.iteration += 1
+
+    def run(self, steps):
+        """Run `steps` generations."""
+        for _ in range(steps):
+            self.step()
+
+    def flush(self):
+        """Write the current generation to disk."""
+        for field in FIELDS:
+            getattr(self.state, field).flush()
@@ -1,27 +1,40 @@
-import matplotlib.pyplot as plt
-import numpy as np
-
-def read_averages(file_path):
-    """Reads averages from a file and returns a list of floats."""
+def read_observations(file_path):
+    """
+    Reads (iteration, average) lines from a file and returns the list of iterations and the list of averages.
+    Lines holding only an average are numbered 1, 2, 3, ... (one per day).
+    """
+    iterations = []
     averages = []
     try:
         with open(file_path, "r") as file:
             for line in file:
-                value = float(line.strip())
-                averages.append(value)
+                fields = line.split()
+                iterations.append(int(fields[0]) if len(fields) > 1 else len(iterations) + 1)
+                averages.append(float(fields[-1]))
     except FileNotFoundError:
         print(f"File {file_path} not found.")
     except ValueError:
         print(f"Non-numeric data encountered in {file_path}.")
-    return averages
+    return iterations, averages
 
+def read_averages(file_path):
+    """Reads averages from a file and returns a list of floats."""
+    return read_observations(file_path)[1]
 
-def plot_combined_with_separate_std_and_normalized(temp_averages, pollution_averages):
+
+def plot_combined_with_separate_std_and_normalized(temp_averages, pollution_averages, days=None):
     """
     Plots temperature, pollution averages, their respective standard deviations,
     and normalized values for both in the same window.
+    `days` holds the iteration of every average (see read_observations); by default
+    each value corresponds to a day.
     """
-    days = range(1, len(temp_averages) + 1)  # Each value corresponds to a day
+    # Imported here so reading the averages does not load matplotlib and numpy
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    if days is None:
+        days = range(1, len(temp_averages) + 1)  # Each value corresponds to a day
 
     fig, axes = plt.subplots(2, 2, figsize=(14, 12))  # Create a 2x2 grid of subplots
 